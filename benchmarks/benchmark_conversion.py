@@ -0,0 +1,48 @@
+import numpy as np
+
+from hsafm_base import to_height
+from hsafm_base.testing import make_voltage
+
+SCALE = 2.5 * 1.5 * 5 / 4096
+
+
+def legacy_height(voltage, scale):
+    """height conversion as HSAFM did it before to_height"""
+    voltage = np.array(voltage[:, ::-1], dtype="float32")
+    height = -1 * voltage * scale
+    frames, y_pixel, x_pixel = height.shape
+    height -= np.repeat(np.min(height, (1, 2)), y_pixel * x_pixel).reshape(
+        (frames, y_pixel, x_pixel)
+    )
+    height_ = np.zeros((frames, y_pixel - 1, x_pixel - 1), dtype="float32")
+    for i, img in enumerate(height):
+        height_[i] = img[:-1, 1:]
+    return height_
+
+
+class HeightConversion:
+    """synthetic 256x256 stacks, the 5000 frame case needs ~6 GB for legacy"""
+
+    params = ([500, 5000], ["legacy", "to_height"])
+    param_names = ["frames", "method"]
+    timeout = 600
+
+    def setup(self, frames, method):
+        self.voltage = make_voltage(frames, 257, 257)
+        self.convert = legacy_height if method == "legacy" else to_height
+
+    def time_convert(self, frames, method):
+        self.convert(self.voltage, SCALE)
+
+    def peakmem_convert(self, frames, method):
+        self.convert(self.voltage, SCALE)
+
+    def track_throughput(self, frames, method):
+        """MB of raw voltage converted per second"""
+        import time
+
+        start = time.perf_counter()
+        self.convert(self.voltage, SCALE)
+        return self.voltage.nbytes / 1e6 / (time.perf_counter() - start)
+
+    track_throughput.unit = "MB/s"
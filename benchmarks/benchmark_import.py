@@ -0,0 +1,11 @@
+class Import:
+    """import cost of the reader in a fresh interpreter, no GUI stack"""
+
+    def timeraw_import_hsafm_base(self):
+        return "import hsafm_base"
+
+    def timeraw_import_convert(self):
+        return "import hsafm_base.convert"
+
+    def timeraw_import_lut(self):
+        return "from hsafm_base.lut import AFM_LUT"
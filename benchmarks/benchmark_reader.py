@@ -0,0 +1,132 @@
+"""open, frame access and export of asd files
+
+set HSAFM_BENCHMARK_ASD to the path of a real recording (e.g. a 10 GB movie)
+to benchmark it instead of the synthetic files; the frames and channels
+parameters are then ignored
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from hsafm_base import HSAFM, read_header
+from hsafm_base.cache import HeightCache
+from hsafm_base.export import export_tiff
+from hsafm_base.testing import write_synthetic
+
+ASD = os.environ.get("HSAFM_BENCHMARK_ASD")
+FRAMES = [200, 2000]
+CHANNELS = [1, 2]
+PIXELS = 257  # 256 x 256 height frames
+
+
+def make_files():
+    """synthetic files for every (frames, channels)
+
+    shared by all classes below, asv runs it once in a directory it removes
+    after the run
+    """
+    files = {}
+    for frames in FRAMES:
+        for channels in CHANNELS:
+            fname = os.path.abspath(f"{frames}-{channels}.asd")
+            files[frames, channels] = write_synthetic(
+                fname, frames, PIXELS, PIXELS, channels
+            )
+    return files
+
+
+def asd_file(files, frames, channels=1):
+    return ASD or files[frames, channels]
+
+
+class Open:
+    """HSAFM construction, eager decodes every channel, lazy maps the file"""
+
+    params = (FRAMES, CHANNELS, ["eager", "lazy"])
+    param_names = ["frames", "channels", "mode"]
+    timeout = 600
+
+    setup_cache = staticmethod(make_files)
+
+    def time_open(self, files, frames, channels, mode):
+        HSAFM(asd_file(files, frames, channels), mmap=mode == "lazy")
+
+    def peakmem_open(self, files, frames, channels, mode):
+        HSAFM(asd_file(files, frames, channels), mmap=mode == "lazy")
+
+    def time_read_header(self, files, frames, channels, mode):
+        read_header(asd_file(files, frames, channels))
+
+
+class FrameAccess:
+    """latency of reading random frames, as napari does while scrubbing"""
+
+    params = (FRAMES, ["eager", "lazy", "cache"])
+    param_names = ["frames", "mode"]
+    timeout = 600
+
+    setup_cache = staticmethod(make_files)
+
+    def setup(self, files, frames, mode):
+        fname = asd_file(files, frames)
+        cache = None
+        if mode == "cache":
+            self.cache_dir = tempfile.TemporaryDirectory()
+            cache = HeightCache(self.cache_dir.name, 2 ** 40)
+            HSAFM(fname, cache=cache)  # converted once, only mapped below
+        self.hsafm = HSAFM(fname, mmap=mode != "eager", cache=cache)
+        rng = np.random.default_rng(0)
+        self.indices = rng.integers(0, len(self.hsafm.height), 64)
+
+    def teardown(self, files, frames, mode):
+        if mode == "cache":
+            del self.hsafm
+            self.cache_dir.cleanup()
+
+    def time_random_frames(self, files, frames, mode):
+        for index in self.indices:
+            np.asarray(self.hsafm.height[index])
+
+    def track_frame_latency(self, files, frames, mode):
+        """ms per randomly accessed frame"""
+        start = time.perf_counter()
+        self.time_random_frames(files, frames, mode)
+        return (time.perf_counter() - start) * 1000 / len(self.indices)
+
+    track_frame_latency.unit = "ms"
+
+
+class Export:
+    """streaming ImageJ tiff export of the height stack"""
+
+    params = (FRAMES, ["eager", "lazy"])
+    param_names = ["frames", "mode"]
+    timeout = 600
+
+    setup_cache = staticmethod(make_files)
+
+    def setup(self, files, frames, mode):
+        self.hsafm = HSAFM(asd_file(files, frames), mmap=mode == "lazy")
+        self.out = tempfile.TemporaryDirectory()
+
+    def teardown(self, files, frames, mode):
+        self.out.cleanup()
+
+    def export(self):
+        export_tiff(self.hsafm, os.path.join(self.out.name, "movie.tiff"))
+
+    def time_export(self, files, frames, mode):
+        self.export()
+
+    def peakmem_export(self, files, frames, mode):
+        self.export()
+
+    def track_throughput(self, files, frames, mode):
+        """MB of float32 height written per second"""
+        start = time.perf_counter()
+        self.export()
+        return self.hsafm.height.nbytes / 1e6 / (time.perf_counter() - start)
+
+    track_throughput.unit = "MB/s"
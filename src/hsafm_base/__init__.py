@@ -0,0 +1 @@
+from .hsafm_base import HSAFM, read_header, to_height
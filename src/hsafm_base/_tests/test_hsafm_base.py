@@ -0,0 +1,381 @@
+import os
+
+import numpy as np
+import pytest
+
+from hsafm_base import HSAFM, convert, read_header, to_height
+from hsafm_base.cache import HeightCache
+from hsafm_base.drift import (
+    corrected,
+    drift_sidecar,
+    estimate_drift,
+    load_drift,
+    shift_frame,
+)
+from hsafm_base.edits import FrameEdits, edits_sidecar
+from hsafm_base.export import export_tiff
+from hsafm_base.index import MetadataIndex
+from hsafm_base.kymograph import hsafm_kymograph, kymograph
+from hsafm_base.level import header_tilt, level, leveled
+from hsafm_base.pyramid import block_average, pyramid
+from hsafm_base.stats import contrast_limits, header_limits, header_range
+from hsafm_base.temporal import TemporalFilter, temporal_filter
+from hsafm_base.testing import make_voltage, write_asd, write_synthetic
+from hsafm_base.thumbnails import Thumbnails, keyframes
+
+
+@pytest.fixture
+def asd_file(tmp_path):
+    return write_asd(str(tmp_path / "test.asd"), make_voltage(12, 32, 48))
+
+
+def test_eager_read(asd_file):
+    hsafm = HSAFM(asd_file)
+    assert hsafm.height.shape == (12, 31, 47)
+    assert hsafm.height.dtype == np.float32
+    assert hsafm.comment == "synthetic"
+    assert list(hsafm.frameNumber) == list(range(12))
+
+
+def test_mmap_matches_eager(asd_file):
+    eager = HSAFM(asd_file)
+    mapped = HSAFM(asd_file, mmap=True)
+    assert isinstance(mapped.voltage, np.memmap)
+    assert mapped.voltage.shape == (12, 32, 48)
+    np.testing.assert_array_equal(mapped.frameMaxData, eager.frameMaxData)
+    for i in (0, 5, 11):
+        np.testing.assert_allclose(mapped.frame(i), eager.height[i], atol=1e-4)
+
+
+def test_lazy_height(asd_file):
+    eager = HSAFM(asd_file)
+    lazy = HSAFM(asd_file, mmap=True).height
+    assert lazy.shape == eager.height.shape
+    assert lazy.dtype == eager.height.dtype
+    np.testing.assert_allclose(lazy[-1], eager.height[-1], atol=1e-4)
+    np.testing.assert_allclose(lazy[2:9:3, 1, ...], eager.height[2:9:3, 1], atol=1e-4)
+    np.testing.assert_allclose(np.asarray(lazy), eager.height, atol=1e-4)
+
+
+def test_read_header(asd_file):
+    header = read_header(asd_file)
+    assert header["xPixel"] == 48 and header["yPixel"] == 32
+    assert header["ADRange"] == 5
+    assert header["comment"] == "synthetic"
+    assert isinstance(header["frameNumber"], np.ndarray)
+    np.testing.assert_array_equal(header["frameNumber"], np.arange(12))
+    assert header["laserFlag"].shape == (12, 12)
+    assert header["frameMaxData"].dtype == np.uint16
+
+
+@pytest.mark.parametrize("scale", [0.75, -0.5])
+def test_to_height(scale):
+    voltage = make_voltage(7, 16, 24)
+    # reference: the original float32 pipeline
+    height = -1 * np.array(voltage[:, ::-1], dtype="float32") * scale
+    height -= height.min((1, 2), keepdims=True)
+    expected = height[:, :-1, 1:]
+
+    np.testing.assert_allclose(to_height(voltage, scale, chunk=3), expected, atol=1e-3)
+
+
+def test_load(asd_file):
+    hsafm = HSAFM(asd_file, mmap=True)
+    assert hsafm.nbytes == 0
+    assert list(hsafm.load(chunk=5)) == [5, 10, 12]
+    assert isinstance(hsafm.height, np.ndarray)
+    np.testing.assert_array_equal(hsafm.height, HSAFM(asd_file).height)
+
+
+def test_metadata_index(tmp_path):
+    write_asd(str(tmp_path / "a.asd"), make_voltage(3, 8, 8), comment="first")
+    write_asd(str(tmp_path / "b.asd"), make_voltage(5, 8, 8), comment="second")
+    index = MetadataIndex(str(tmp_path))
+    assert sorted(name for name, _ in index.build()) == ["a.asd", "b.asd"]
+    index.save()
+
+    index = MetadataIndex(str(tmp_path))
+    assert list(index.build()) == []  # reused from the sidecar
+    assert index.get("b.asd")["frames"] == 5
+    assert index.get("a.asd")["date"] == "2023-05-08 12:30:15"
+
+    write_asd(str(tmp_path / "a.asd"), make_voltage(4, 8, 8), comment="rewritten")
+    (tmp_path / "b.asd").unlink()
+    assert [name for name, _ in index.build()] == ["a.asd"]
+    assert set(index.entries) == {"a.asd"}
+
+
+def test_export_tiff(asd_file, tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    hsafm = HSAFM(asd_file, mmap=True)
+    done = []
+    export_tiff(hsafm, str(tmp_path / "test.tiff"), chunk=5, progress=done.append)
+    assert done == [5, 10, 12]
+    with tifffile.TiffFile(str(tmp_path / "test.tiff")) as tif:
+        assert tif.series[0].axes == "ZYX"
+        assert tif.imagej_metadata["unit"] == "nm"
+        np.testing.assert_allclose(tif.asarray(), HSAFM(asd_file).height)
+
+
+def test_convert(tmp_path, capsys):
+    (tmp_path / "day1").mkdir()
+    fname = write_asd(str(tmp_path / "day1" / "a.asd"), make_voltage(4, 8, 8))
+    assert convert.main([str(tmp_path), "-f", "npy", "-j", "1"]) == 0
+    np.testing.assert_array_equal(
+        np.load(str(tmp_path / "day1" / "a.npy")), HSAFM(fname).height
+    )
+    assert "4 frames" in capsys.readouterr().out
+
+    convert.main([str(tmp_path), "-f", "npy", "-j", "1"])
+    assert "up to date" in capsys.readouterr().out
+
+
+def test_second_channel(tmp_path):
+    height, phase = make_voltage(6, 16, 16, seed=1), make_voltage(6, 16, 16, seed=2)
+    fname = write_asd(str(tmp_path / "two.asd"), height, voltage_ch2=phase)
+    single = HSAFM(write_asd(str(tmp_path / "one.asd"), height))
+
+    for mmap in (False, True):
+        hsafm = HSAFM(fname, mmap=mmap)
+        assert hsafm.numberChannels == 2
+        assert len(hsafm.height) == 6  # Ch2 is not read as more frames
+        assert hsafm.channel_name(1) == "phase (V)"
+        np.testing.assert_allclose(hsafm.height[3], single.height[3], atol=1e-4)
+        expected = -(phase[:, ::-1][:, :-1, 1:] * (hsafm.ADRange / 4096))
+        np.testing.assert_allclose(hsafm.channels[1][4], expected[4], atol=1e-4)
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_refresh(tmp_path, mmap):
+    voltage = make_voltage(9, 16, 16)
+    fname = write_asd(str(tmp_path / "live.asd"), voltage[:4])
+    hsafm = HSAFM(fname, mmap=mmap)
+    assert hsafm.refresh() == 0
+
+    write_asd(fname, voltage)  # the instrument appended 5 frames
+    assert hsafm.refresh() == 5
+    assert len(hsafm.height) == len(hsafm.frameNumber) == 9
+    np.testing.assert_allclose(hsafm.height[8], HSAFM(fname).height[8], atol=1e-4)
+
+
+def test_refresh_keeps_prefix(tmp_path):
+    voltage = make_voltage(9, 16, 16)
+    fname = write_asd(str(tmp_path / "live.asd"), voltage[:4])
+    cache = HeightCache(str(tmp_path / "cache"), max_bytes=2 ** 20)
+    hsafm = HSAFM(fname, cache=cache)
+    mapped = hsafm.height
+    for stop in range(5, 10):  # one frame per poll
+        write_asd(fname, voltage[:stop])
+        assert hsafm.refresh() == 1
+    assert hsafm.height.parts[0] is mapped  # neither copied nor loaded
+    assert hsafm.nbytes < 2 * 5 * 15 * 15 * 4 and not hsafm.lazy
+    np.testing.assert_allclose(hsafm.height[:], HSAFM(fname).height, atol=1e-4)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_height_cache(asd_file, tmp_path, dtype):
+    expected = HSAFM(asd_file).height
+    cache = HeightCache(str(tmp_path / "cache"), max_bytes=2 ** 20, dtype=dtype)
+    first = HSAFM(asd_file, cache=cache)
+    assert isinstance(first.height, np.memmap) and first.nbytes == 0
+    again = HSAFM(asd_file, mmap=True, cache=cache)
+    assert not again.lazy
+    np.testing.assert_allclose(again.height, expected, rtol=1e-3, atol=1e-2)
+
+    # entries over the limit evict the least recently used one
+    cache.max_bytes = first.height.nbytes
+    other = write_asd(str(tmp_path / "other.asd"), make_voltage(12, 32, 48, seed=3))
+    HSAFM(other, cache=cache)
+    assert cache.get(other) is not None and cache.get(asd_file) is None
+
+
+def test_height_cache_partial(asd_file, tmp_path):
+    cache = HeightCache(str(tmp_path / "cache"), max_bytes=2 ** 20)
+    writer = cache.write(HSAFM(asd_file, mmap=True), chunk=4)
+    next(writer)
+    writer.close()  # a newer selection quit the load
+    assert os.listdir(cache.directory) == []
+
+    stale = os.path.join(cache.directory, "killed.npy.part")
+    open(stale, "wb").close()
+    os.utime(stale, (0, 0))
+    cache.evict()
+    assert not os.path.exists(stale)
+
+
+@pytest.mark.parametrize("reference", ["first", "running"])
+def test_drift(reference):
+    y, x = np.mgrid[:48, :40]
+    frame = np.sin(x / 5) * np.cos(y / 7)
+    frame += np.exp(-((x - 20) ** 2 + (y - 30) ** 2) / 30)
+    rng = np.random.default_rng(0)
+    true = np.cumsum(rng.normal(0, 0.7, (20, 2)), 0)
+    true[0] = 0
+    stack = np.stack([shift_frame(frame, shift) for shift in true])
+    shifts = estimate_drift(stack, reference, batch=6, workers=2)
+    np.testing.assert_allclose(shifts, true, atol=0.25)
+    np.testing.assert_allclose(corrected(stack, shifts)[7], frame, atol=0.35)
+
+
+def test_drift_sidecar(asd_file):
+    hsafm = HSAFM(asd_file, mmap=True)
+    shifts = load_drift(hsafm)
+    assert shifts.shape == (12, 2)
+    np.testing.assert_array_equal(np.load(drift_sidecar(asd_file)), shifts)
+
+
+@pytest.mark.parametrize("method", ["plane", "line", "tilt"])
+def test_level(method):
+    y, x = np.mgrid[:24, :32]
+    slopes = np.random.default_rng(0).normal(size=(10, 2))
+    stack = slopes[:, :1, None] * x + slopes[:, 1:, None] * y + 5
+    tilt = (slopes[:, 0], slopes[:, 1])
+    flat = level(stack, method, tilt=tilt, chunk=4)
+    np.testing.assert_allclose(flat, 0, atol=1e-4)
+    lazy = leveled(stack, method, tilt=tilt)
+    np.testing.assert_allclose(lazy[3], flat[3], atol=1e-4)
+    np.testing.assert_allclose(lazy[2:6], flat[2:6], atol=1e-4)
+
+
+def test_header_tilt(tmp_path):
+    # raw frames tilted by the slopes their headers record
+    y, x = np.mgrid[:16, :24]
+    voltage = (1000 + 3 * x + 2 * y)[None].repeat(4, 0).astype("u2")
+    hsafm = HSAFM(write_asd(str(tmp_path / "tilted.asd"), voltage))
+    hsafm.xTilt, hsafm.yTilt = np.full(4, 3.0), np.full(4, 2.0)
+    flat = leveled(hsafm.height, "tilt", tilt=header_tilt(hsafm))
+    np.testing.assert_allclose(flat[:], 0, atol=1e-3)
+
+
+def test_stats(asd_file):
+    hsafm = HSAFM(asd_file)
+    assert hsafm._stats is not None  # taken while decoding
+    lazy = HSAFM(asd_file, mmap=True)
+    height = hsafm.height
+    for stats in (hsafm.stats, lazy.stats):
+        np.testing.assert_allclose(stats["max"], height.max((1, 2)))
+        np.testing.assert_allclose(stats["mean"], height.mean((1, 2)), rtol=1e-5)
+        assert stats["histogram"].shape == (12, 256)
+        # percentiles come from a sample of the scan lines
+        expected = np.percentile(height.reshape(12, -1), [1, 50, 99], axis=1).T
+        span = (stats["max"] - stats["min"])[:, None]
+        assert np.all(abs(stats["percentiles"] - expected) < 0.05 * span)
+    assert np.all(header_range(hsafm) >= hsafm.stats["max"] - 1e-4)
+    assert header_limits(hsafm)[1] >= hsafm.stats["max"].max() - 1e-4
+    low, high = contrast_limits(hsafm.stats)
+    assert 0 <= low < high <= height.max()
+
+
+def test_frame_edits(asd_file):
+    height = HSAFM(asd_file).height
+    edits = FrameEdits(len(height))
+    assert edits.view(height) is height
+    edits.delete(3)
+    edits.delete(3)  # source frame 4
+    edits.trim(1, 8)
+    np.testing.assert_array_equal(edits.frames, [1, 2, 5, 6, 7, 8, 9])
+    view = edits.view(height)
+    assert view.shape == (7,) + height.shape[1:]
+    np.testing.assert_array_equal(view[2], height[5])
+    np.testing.assert_array_equal(view[1:4], height[[2, 5, 6]])
+
+    edits.save(asd_file)
+    loaded = FrameEdits.load(asd_file, len(height))
+    np.testing.assert_array_equal(loaded.keep, edits.keep)
+    loaded.restore()
+    loaded.save(asd_file)
+    assert FrameEdits.load(asd_file, len(height)).keep.all()
+    assert not os.path.exists(edits_sidecar(asd_file))
+
+
+def test_write_synthetic(tmp_path):
+    fname = write_synthetic(str(tmp_path / "big.asd"), 40, 17, 9, channels=2)
+    hsafm = HSAFM(fname, mmap=True)
+    assert hsafm.height.shape == hsafm.channels[1].shape == (40, 16, 8)
+    np.testing.assert_array_equal(hsafm.frameNumber, np.arange(40))
+    assert np.all(hsafm.frameMaxData == hsafm.voltage.max((1, 2)))
+
+
+def test_thumbnails(asd_file, tmp_path):
+    strip = keyframes(asd_file, size=16)
+    assert strip.dtype == np.uint8 and strip.shape == (10, 3 * 15 + 2)
+    (tmp_path / "broken.asd").write_bytes(b"not an asd file")
+    thumbnails = Thumbnails(str(tmp_path), size=16)
+    built = dict(thumbnails.build(["test.asd", "broken.asd"], workers=1))
+    assert list(built) == ["test.asd"]
+    np.testing.assert_array_equal(built["test.asd"], strip)
+    np.testing.assert_array_equal(thumbnails.get("test.asd"), strip)
+
+
+def test_thumbnails_read_only(asd_file, tmp_path):
+    (tmp_path / ".hsafm").write_bytes(b"")  # the sidecar cannot be made
+    thumbnails = Thumbnails(str(tmp_path), size=16)
+    built = dict(thumbnails.build(["test.asd"], workers=1))
+    np.testing.assert_array_equal(built["test.asd"], keyframes(asd_file, size=16))
+    assert thumbnails.get("test.asd") is None
+
+
+def test_pyramid():
+    stack = np.random.default_rng(0).random((5, 37, 64), dtype="float32")
+    levels = pyramid(stack, min_size=8)
+    assert [level.shape for level in levels] == [(5, 37, 64), (5, 18, 32), (5, 9, 16)]
+    expected = stack[2, :36].reshape(18, 2, 32, 2).mean((1, 3))
+    np.testing.assert_allclose(levels[1][2], expected, rtol=1e-6)
+    np.testing.assert_allclose(levels[2][1:3], block_average(block_average(stack[1:3])))
+    assert levels[2].get_frame(4) is levels[2].get_frame(4)  # cached
+    assert len(pyramid(stack, min_size=32)) == 1
+
+
+@pytest.mark.parametrize("storage, atol", [("float16", 1e-2), ("uint16", 1e-6)])
+def test_storage(tmp_path, storage, atol):
+    voltage = make_voltage(9, 16, 24)
+    fname = write_asd(str(tmp_path / "half.asd"), voltage[:5], voltage_ch2=voltage[:5])
+    expected = HSAFM(fname)
+    hsafm = HSAFM(fname, storage=storage)
+    assert not hsafm.lazy
+    assert hsafm.nbytes < 0.6 * expected.nbytes
+    assert hsafm.height.dtype == np.float32
+    np.testing.assert_allclose(hsafm.height[:], expected.height, atol=atol)
+    np.testing.assert_allclose(hsafm.channels[1][2], expected.channels[1][2], atol=atol)
+    np.testing.assert_allclose(hsafm.stats["max"], expected.stats["max"], atol=atol)
+
+    write_asd(fname, voltage, voltage_ch2=voltage)
+    assert hsafm.refresh() == 4
+    np.testing.assert_allclose(hsafm.height[8], HSAFM(fname).height[8], atol=atol)
+
+
+def test_kymograph(asd_file):
+    lazy = HSAFM(asd_file, mmap=True)
+    height = HSAFM(asd_file).height
+    # along a row the points fall on pixels, bilinear interpolation is exact
+    np.testing.assert_allclose(kymograph(height, (4, 2), (4, 12)), height[:, 4, 2:13])
+    start, end = (1.5, 3.25), (27.5, 40)
+    expected = kymograph(height, start, end)
+    assert expected.shape == (12, 47)
+    np.testing.assert_allclose(hsafm_kymograph(lazy, start, end), expected, atol=1e-4)
+    np.testing.assert_allclose(kymograph(lazy.height, start, end, chunk=5), expected)
+
+
+@pytest.mark.parametrize("method", ["mean", "median", "gaussian"])
+def test_temporal_filter(method):
+    stack = np.random.default_rng(0).random((30, 6, 7), dtype="float32")
+    half = 3 if method == "gaussian" else 2
+    expected = []
+    for i in range(len(stack)):
+        window = stack[max(i - half, 0) : i + half + 1]
+        times = np.arange(max(i - half, 0), min(i + half + 1, 30)) - i
+        if method == "mean":
+            expected.append(window.mean(0))
+        elif method == "median":
+            expected.append(np.median(window, 0))
+        else:
+            weights = np.exp(-0.5 * times ** 2)
+            expected.append(np.tensordot(weights / weights.sum(), window, axes=1))
+    expected = np.array(expected)
+
+    bulk = temporal_filter(stack, method, window=5, sigma=1.0, chunk=7)
+    np.testing.assert_allclose(bulk, expected, atol=1e-6)
+    lazy = TemporalFilter(stack, method, window=5, sigma=1.0)
+    for i in [0, 1, 2, 3, 10, 9, 29, 28, 0, 15, 16, 14]:  # steps, jumps, back
+        np.testing.assert_allclose(lazy[i], expected[i], atol=1e-6)
+    np.testing.assert_allclose(lazy[5:12], expected[5:12], atol=1e-6)
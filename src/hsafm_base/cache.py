@@ -0,0 +1,125 @@
+import hashlib
+from os import listdir, makedirs, path, remove, replace, stat, utime
+from time import time
+
+import numpy as np
+
+from .hsafm_base import to_height
+
+SAMPLE_SIZE = 2 ** 16  # bytes hashed from each end of the source file
+PARTIAL = ".part"  # suffix of an entry being written
+STALE = 600  # s without a write after which a partial entry is abandoned
+
+
+class HeightCache:
+    """decoded height stacks kept as memmappable .npy files
+
+    entries are keyed by a hash of the source path, size, mtime and the
+    first and last bytes of its content, so an edited or replaced file is
+    decoded again. The directory is bounded by max_bytes, least recently
+    opened entries are evicted first. dtype may be float16 to halve the size
+    """
+
+    def __init__(self, directory, max_bytes, dtype="float32"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        makedirs(directory, exist_ok=True)
+
+    def key(self, fname):
+        st = stat(fname)
+        digest = hashlib.sha1(
+            f"{path.abspath(fname)}|{st.st_size}|{st.st_mtime_ns}".encode()
+        )
+        digest.update(str(self.dtype).encode())
+        with open(fname, "rb") as f:
+            digest.update(f.read(SAMPLE_SIZE))
+            f.seek(max(0, st.st_size - SAMPLE_SIZE))
+            digest.update(f.read(SAMPLE_SIZE))
+        return digest.hexdigest()
+
+    def path(self, fname):
+        return path.join(self.directory, self.key(fname) + ".npy")
+
+    def get(self, fname):
+        """the cached height stack of fname, memory-mapped, or None"""
+        cached = self.path(fname)
+        if not path.exists(cached):
+            return None
+        utime(cached)  # mark as recently used
+        return np.load(cached, mmap_mode="r")
+
+    def accepts(self, shape):
+        return int(np.prod(shape)) * self.dtype.itemsize <= self.max_bytes
+
+    def write(self, hsafm, chunk=64):
+        """convert hsafm.voltage straight into a cache entry
+
+        a generator yielding the number of frames written; the entry only
+        appears once complete, then older entries are evicted. The partial
+        file is removed when the generator is closed early or fails
+        """
+        shape = (len(hsafm.voltage), int(hsafm.yPixel) - 1, int(hsafm.xPixel) - 1)
+        if not self.accepts(shape):
+            return
+        cached = self.path(hsafm.fullName)
+        temp = cached + PARTIAL
+        out = np.lib.format.open_memmap(temp, mode="w+", dtype=self.dtype, shape=shape)
+        try:
+            for start in range(0, len(out), chunk):
+                stop = min(start + chunk, len(out))
+                voltage = hsafm.voltage[start:stop]
+                if self.dtype == np.float32:
+                    to_height(voltage, hsafm.zScale, out=out[start:stop])
+                else:
+                    out[start:stop] = to_height(voltage, hsafm.zScale)
+                yield stop
+            out.flush()
+            del out
+            replace(temp, cached)
+        finally:
+            out = None  # unmapped before the partial file is removed
+            if path.exists(temp):
+                try:
+                    remove(temp)
+                except OSError:  # still mapped on Windows, see evict
+                    pass
+        self.evict(keep=cached)
+
+    def put(self, hsafm):
+        """write hsafm into the cache and return the mapped stack, or None"""
+        for _ in self.write(hsafm):
+            pass
+        return self.get(hsafm.fullName)
+
+    def evict(self, keep=None):
+        """remove least recently used entries until max_bytes is met
+
+        partial files count towards max_bytes while being written and are
+        removed once stale, e.g. left by a process that was killed
+        """
+        entries = []
+        writing = 0
+        for name in listdir(self.directory):
+            fname = path.join(self.directory, name)
+            try:
+                st = stat(fname)
+                if name.endswith(PARTIAL) and time() - st.st_mtime > STALE:
+                    remove(fname)
+                elif name.endswith(PARTIAL):
+                    writing += st.st_size
+                elif name.endswith(".npy"):
+                    entries.append((st.st_mtime, st.st_size, fname))
+            except OSError:  # removed meanwhile, or still mapped on Windows
+                continue
+        total = writing + sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if fname == keep:
+                continue
+            try:
+                remove(fname)
+            except OSError:  # still mapped on Windows
+                continue
+            total -= size
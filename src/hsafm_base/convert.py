@@ -0,0 +1,142 @@
+"""convert directory trees of asd files without napari
+
+    hsafm-convert DATA_DIR -o OUT_DIR --format tiff npy -j 8
+"""
+import argparse
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import cpu_count, makedirs, path, replace, walk
+
+import numpy as np
+
+from .export import export_tiff
+from .hsafm_base import HSAFM, to_height
+from .index import INDEX_DIR
+
+FORMATS = {"tiff": ".tiff", "npy": ".npy", "zarr": ".zarr"}
+
+
+def find_asd(src):
+    """relative paths of all asd files below src"""
+    found = []
+    for root, dirs, files in walk(src):
+        dirs[:] = sorted(d for d in dirs if d != INDEX_DIR)
+        for f in sorted(files):
+            if f.endswith(".asd") and not f.startswith("._"):
+                found.append(path.relpath(path.join(root, f), src))
+    return found
+
+
+def is_up_to_date(src, dst):
+    return path.exists(dst) and path.getmtime(dst) >= path.getmtime(src)
+
+
+def _write_npy(hsafm, fname, chunk=64):
+    out = np.lib.format.open_memmap(
+        fname, mode="w+", dtype="float32", shape=hsafm.height.shape
+    )
+    for start in range(0, len(out), chunk):
+        stop = min(start + chunk, len(out))
+        to_height(hsafm.voltage[start:stop], hsafm.zScale, out=out[start:stop])
+    out.flush()
+    del out
+
+
+def _write_zarr(hsafm, fname, chunk=64):
+    import zarr
+
+    out = zarr.open_array(
+        store=fname,
+        mode="w",
+        shape=hsafm.height.shape,
+        chunks=(1,) + hsafm.height.shape[1:],
+        dtype="float32",
+    )
+    for start in range(0, len(hsafm.height), chunk):
+        stop = min(start + chunk, len(hsafm.height))
+        out[start:stop] = to_height(hsafm.voltage[start:stop], hsafm.zScale)
+
+
+def convert_file(src, dst, formats):
+    """convert src to dst + extension for each format
+
+    outputs are written under a temporary name and moved in place once done,
+    returns (frames, bytes read, seconds)
+    """
+    start = time.perf_counter()
+    hsafm = HSAFM(src, mmap=True)
+    makedirs(path.dirname(dst) or ".", exist_ok=True)
+    for fmt in formats:
+        fname = dst + FORMATS[fmt]
+        temp = fname + ".part"
+        if fmt == "tiff":
+            export_tiff(hsafm, temp)
+        elif fmt == "npy":
+            _write_npy(hsafm, temp)
+        else:
+            _write_zarr(hsafm, temp)
+        if path.isdir(fname):
+            shutil.rmtree(fname)
+        replace(temp, fname)
+    return len(hsafm.height), path.getsize(src), time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="hsafm-convert",
+        description="convert high-speed AFM .asd files to height (nm) stacks",
+    )
+    parser.add_argument("src", help="directory searched recursively for .asd files")
+    parser.add_argument(
+        "-o", "--output", help="output directory (default: next to the .asd files)"
+    )
+    parser.add_argument(
+        "-f", "--format", nargs="+", choices=list(FORMATS), default=["tiff"]
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=cpu_count(), help="worker processes"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="convert files that are up to date"
+    )
+    args = parser.parse_args(argv)
+
+    output = args.output or args.src
+    jobs = {}
+    for rel in find_asd(args.src):
+        src = path.join(args.src, rel)
+        dst = path.join(output, path.splitext(rel)[0])
+        formats = [
+            fmt
+            for fmt in args.format
+            if args.force or not is_up_to_date(src, dst + FORMATS[fmt])
+        ]
+        if formats:
+            jobs[src] = (dst, formats)
+        else:
+            print(f"{rel}: up to date")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(convert_file, src, dst, formats): src
+            for src, (dst, formats) in jobs.items()
+        }
+        for future in as_completed(futures):
+            rel = path.relpath(futures[future], args.src)
+            try:
+                frames, size, seconds = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{rel}: failed, {e}")
+                continue
+            print(
+                f"{rel}: {frames} frames, {size / 1e6:.1f} MB in {seconds:.2f} s "
+                f"({size / 1e6 / seconds:.1f} MB/s)"
+            )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
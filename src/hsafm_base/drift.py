@@ -0,0 +1,142 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count, makedirs, path
+
+import numpy as np
+
+from .index import INDEX_DIR
+from .stack import LazyStack
+
+
+def _spectra(stack, start, batch):
+    frames = np.asarray(stack[start : start + batch], dtype="float32")
+    frames -= frames.mean((1, 2), keepdims=True)
+    return np.fft.rfft2(frames)
+
+
+def _bounded_map(pool, fn, items, ahead):
+    """pool.map that keeps at most ahead calls in flight, in order"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _phase_ramp(shape, shifts):
+    """rfft2 multipliers that shift frames of shape by shifts (n, 2)"""
+    ky = np.fft.fftfreq(shape[0])[:, None]
+    kx = np.fft.rfftfreq(shape[1])[None, :]
+    return np.exp(
+        -2j * np.pi * (ky * shifts[:, 0, None, None] + kx * shifts[:, 1, None, None])
+    )
+
+
+def register(spectra, reference, shape):
+    """subpixel shifts (n, 2) of frames against a reference, by phase correlation
+
+    spectra are the rfft2 of the frames and reference the rfft2 of the
+    reference frame; a frame equal to the reference moved by (dy, dx) gives
+    (dy, dx). The peak is refined with a parabola along each axis
+    """
+    cross = spectra * np.conj(reference)
+    cross /= np.abs(cross) + 1e-12
+    corr = np.fft.irfft2(cross, s=shape)
+
+    n = len(corr)
+    peak = corr.reshape(n, -1).argmax(1)
+    py, px = np.unravel_index(peak, shape)
+    frames = np.arange(n)
+    shifts = np.empty((n, 2))
+    for axis, (p, size) in enumerate(zip((py, px), shape)):
+        step = [0, 0]
+        step[axis] = 1
+        centre = corr[frames, py, px]
+        before = corr[frames, (py - step[0]) % shape[0], (px - step[1]) % shape[1]]
+        after = corr[frames, (py + step[0]) % shape[0], (px + step[1]) % shape[1]]
+        curvature = before - 2 * centre + after
+        peaked = curvature < 0
+        offset = 0.5 * (before - after) / np.where(peaked, curvature, 1)
+        offset = np.where(peaked, offset, 0)
+        shift = p + np.clip(offset, -0.5, 0.5)
+        shifts[:, axis] = np.where(shift > size / 2, shift - size, shift)
+    return shifts
+
+
+def estimate_drift(stack, reference="first", batch=64, workers=None):
+    """drift (frames, 2) in pixels (y, x) of every frame of a stack
+
+    reference is "first" (the first frame) or "running" (the average of the
+    previous aligned batch, which follows slow changes of the sample). Frames
+    are read and transformed in batches on a thread pool, so a lazy or
+    memmapped stack is processed in chunks
+    """
+    if reference not in ("first", "running"):
+        raise ValueError(f"unknown reference {reference!r}")
+    shape = stack.shape[1:]
+    starts = range(0, len(stack), batch)
+    workers = workers or cpu_count() or 1
+    shifts = [np.zeros((0, 2))]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ref = _spectra(stack, 0, 1)[0]
+        if reference == "first":
+            shifts += _bounded_map(
+                pool,
+                lambda start: register(_spectra(stack, start, batch), ref, shape),
+                starts,
+                2 * workers,
+            )
+            return np.concatenate(shifts)
+
+        spectra = _bounded_map(
+            pool, lambda start: _spectra(stack, start, batch), starts, 2 * workers
+        )
+        for spec in spectra:
+            batch_shifts = register(spec, ref, shape)
+            shifts.append(batch_shifts)
+            # next reference: this batch moved onto the first frame and
+            # averaged, in Fourier space
+            ref = (spec * _phase_ramp(shape, -batch_shifts)).mean(0)
+    return np.concatenate(shifts)
+
+
+def shift_frame(frame, shift):
+    """frame moved by shift (dy, dx) pixels with a Fourier shift, edges wrap"""
+    spectrum = np.fft.rfft2(frame)
+    spectrum *= _phase_ramp(frame.shape, np.asarray(shift, dtype=float)[None])[0]
+    return np.fft.irfft2(spectrum, s=frame.shape).astype("float32")
+
+
+def corrected(stack, shifts):
+    """lazy drift-corrected view of stack, frames are moved by -shifts"""
+    return LazyStack(
+        lambda index: shift_frame(np.asarray(stack[index]), -shifts[index]),
+        len(stack),
+        stack.shape[1:],
+    )
+
+
+def drift_sidecar(fname, reference="first"):
+    directory, name = path.split(fname)
+    return path.join(directory, INDEX_DIR, f"{name}.drift-{reference}.npy")
+
+
+def load_drift(hsafm, reference="first", **kwargs):
+    """estimate_drift of hsafm.height, cached next to the metadata index"""
+    sidecar = drift_sidecar(hsafm.fullName, reference)
+    fresh = path.exists(sidecar) and (
+        path.getmtime(sidecar) >= path.getmtime(hsafm.fullName)
+    )
+    if fresh:
+        shifts = np.load(sidecar)
+        if len(shifts) == len(hsafm.height):
+            return shifts
+    shifts = estimate_drift(hsafm.height, reference, **kwargs)
+    try:
+        makedirs(path.dirname(sidecar), exist_ok=True)
+        np.save(sidecar, shifts)
+    except OSError:
+        pass
+    return shifts
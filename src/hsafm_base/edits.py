@@ -0,0 +1,92 @@
+import json
+from os import makedirs, path, remove, replace
+
+import numpy as np
+
+from .index import INDEX_DIR
+from .stack import LazyStack
+
+
+def edits_sidecar(fname):
+    directory, name = path.split(fname)
+    return path.join(directory, INDEX_DIR, name + ".edits.json")
+
+
+class FrameEdits:
+    """frames deleted or trimmed from a movie, kept as a mask over the source
+
+    nothing is copied: view(stack) maps the kept frames onto the source
+    stack, so deleting a frame costs O(frames) booleans instead of a copy of
+    the movie. Positions passed to delete and trim are those of the edited
+    movie, as shown in the viewer
+    """
+
+    def __init__(self, length):
+        self.keep = np.ones(length, dtype=bool)
+
+    def __len__(self):
+        return int(self.keep.sum())
+
+    @property
+    def frames(self):
+        """source index of every kept frame"""
+        return np.flatnonzero(self.keep)
+
+    def delete(self, position):
+        self.keep[self.frames[position]] = False
+
+    def trim(self, start=0, stop=None):
+        """keep only the edited frames start:stop"""
+        kept = self.frames
+        self.keep[:] = False
+        self.keep[kept[start:stop]] = True
+
+    def restore(self):
+        self.keep[:] = True
+
+    def extend(self, length):
+        """frames appended to the source (see HSAFM.refresh) are kept"""
+        if length > len(self.keep):
+            self.keep = np.concatenate(
+                [self.keep, np.ones(length - len(self.keep), dtype=bool)]
+            )
+
+    def view(self, stack):
+        """the kept frames of stack, without copying it"""
+        if self.keep.all():
+            return stack
+        frames = self.frames
+        return LazyStack(
+            lambda index: stack[int(frames[index])],
+            len(frames),
+            stack.shape[1:],
+            dtype=stack.dtype,
+            get_frames=lambda index: stack[frames[index]],
+        )
+
+    def save(self, fname):
+        """store the deleted frames next to the metadata index of fname"""
+        sidecar = edits_sidecar(fname)
+        try:
+            if self.keep.all():
+                if path.exists(sidecar):
+                    remove(sidecar)
+                return
+            makedirs(path.dirname(sidecar), exist_ok=True)
+            with open(sidecar + ".tmp", "w") as f:
+                json.dump({"deleted": np.flatnonzero(~self.keep).tolist()}, f)
+            replace(sidecar + ".tmp", sidecar)
+        except OSError:
+            pass
+
+    @classmethod
+    def load(cls, fname, length):
+        """the edits saved for fname, or none"""
+        edits = cls(length)
+        try:
+            with open(edits_sidecar(fname)) as f:
+                deleted = np.asarray(json.load(f)["deleted"], dtype=int)
+        except (OSError, ValueError, KeyError):
+            return edits
+        edits.keep[deleted[deleted < length]] = False
+        return edits
@@ -0,0 +1,43 @@
+import numpy as np
+
+# classic TIFF offsets are 32 bit, keep some room for tags and descriptions
+TIFF_LIMIT = 2 ** 32 - 2 ** 25
+
+
+def export_tiff(hsafm, fname, stack=None, chunk=64, progress=None):
+    """stream a height stack into an ImageJ tiff, frame by frame
+
+    stack defaults to hsafm.height and is read chunk by chunk, so a lazily
+    mapped movie is converted from the source file with bounded memory;
+    progress(frames_written) is called after each chunk. Stacks over 4 GB are
+    written as BigTIFF, which ImageJ hyperstacks do not support
+    """
+    import tifffile
+
+    if stack is None:
+        stack = hsafm.height
+    bigtiff = stack.size * 4 > TIFF_LIMIT
+
+    def pages():
+        for start in range(0, len(stack), chunk):
+            stop = min(start + chunk, len(stack))
+            yield from np.asarray(stack[start:stop], dtype="float32")
+            if progress is not None:
+                progress(stop)
+
+    with tifffile.TiffWriter(fname, bigtiff=bigtiff, imagej=not bigtiff) as tif:
+        tif.write(
+            pages(),
+            shape=stack.shape,
+            dtype="float32",
+            contiguous=True,
+            resolution=(
+                hsafm.xPixel / hsafm.xScanRange,
+                hsafm.yPixel / hsafm.yScanRange,
+            ),
+            metadata={
+                "axes": "ZYX",
+                "unit": "nm",
+                "finterval": hsafm.frameAcqTime / 1000,
+            },
+        )
@@ -1,386 +1,514 @@
+from functools import partial
+from os import path
+
 import numpy as np
-from vispy.color import Colormap
+
+from .stack import ConcatStack, LazyStack
+from .stats import concatenate_stats, frame_stats, stack_stats
+
+
+# fixed part of the file header, followed by operatorName and comment
+FILE_HEADER = np.dtype(
+    [
+        ("fileVersion", "<i4"),
+        ("fileHeaderSize", "<i4"),
+        ("frameHeaderSize", "<i4"),
+        ("encNumber", "<i4"),
+        ("operationNameSize", "<i4"),
+        ("commentSize", "<i4"),
+        ("dataTypeCh1", "<i4"),
+        ("dataTypeCh2", "<i4"),
+        ("numberFramesRecorded", "<i4"),
+        ("numberFramesCurrent", "<i4"),
+        ("scanDirection", "<i4"),
+        ("fileName", "<i4"),
+        ("xPixel", "<i4"),
+        ("yPixel", "<i4"),
+        ("xScanRange", "<i4"),
+        ("yScanRange", "<i4"),
+        ("avgFlag", "?"),
+        ("avgNumber", "<i4"),
+        ("yearRec", "<i4"),
+        ("monthRec", "<i4"),
+        ("dayRec", "<i4"),
+        ("hourRec", "<i4"),
+        ("minuteRec", "<i4"),
+        ("secondRec", "<i4"),
+        ("xRoundDeg", "<i4"),
+        ("yRoundDeg", "<i4"),
+        ("frameAcqTime", "<f4"),
+        ("sensorSens", "<f4"),
+        ("phaseSens", "<f4"),
+        ("offset", "<i4", 4),  # booked region of 12 bytes
+        ("machineNum", "<i4"),
+        ("ADRange", "<i4"),
+        ("ADResolution", "<i4"),
+        ("xMaxScanRange", "<f4"),  # nm
+        ("yMaxScanRange", "<f4"),  # nm
+        ("xPizeoConstant", "<f4"),  # nm/V
+        ("yPizeoConstant", "<f4"),  # nm/V
+        ("zPizeoConstant", "<f4"),  # nm/V
+        ("zDriveGain", "<f4"),
+    ]
+)
+
+# dataTypeCh1/dataTypeCh2, 0 means the channel was not recorded
+DATA_TYPES = {0x5054: "topography", 0x5245: "error", 0x4850: "phase"}
+
+FRAME_HEADER = np.dtype(
+    [
+        ("frameNumber", "<i4"),
+        ("frameMaxData", "<u2"),
+        ("frameMinData", "<u2"),
+        ("xOffset", "<u2"),
+        ("dataType", "<u2"),
+        ("xTilt", "<f4"),
+        ("yTilt", "<f4"),
+        ("laserFlag", "?", 12),
+    ]
+)
+
+
+def frame_dtype(header):
+    """one frame on disk: a frame header followed by yPixel*xPixel u2 voltages"""
+    y_pixel, x_pixel = int(header["yPixel"]), int(header["xPixel"])
+    return np.dtype(
+        {
+            "names": ["header", "voltage"],
+            "formats": [FRAME_HEADER, ("<u2", (y_pixel, x_pixel))],
+            "offsets": [0, int(header["frameHeaderSize"])],
+            "itemsize": int(header["frameHeaderSize"]) + 2 * y_pixel * x_pixel,
+        }
+    )
+
+
+def read_header(fname, frame_headers=True):
+    """read file and frame headers of an asd file into a dict, no pixels
+
+    the fixed file header is one structured record, the frame headers are
+    read as arrays through a strided memmap that skips the image data;
+    frame_headers=False only reads the file header
+    """
+    with open(fname, "rb") as f:
+        record = np.fromfile(f, FILE_HEADER, 1)[0]
+        header = {name: record[name] for name in FILE_HEADER.names}
+
+        # 2023-04-17 debug for commentSize
+        #----------------------------------------
+        header["commentSize"] -= 2
+        #========================================
+
+        header["operatorName"] = f.read(header["operationNameSize"]).decode("UTF-8")
+        header["comment"] = f.read(header["commentSize"]).decode("UTF-8")
+        header["dataOffset"] = f.tell()
+
+    # ADRange
+    if header["ADRange"] == 2 ** 18 or header["ADRange"] == 3:
+        header["ADRange"] = 10
+    elif header["ADRange"] == 2 ** 17 or header["ADRange"] == 2:
+        header["ADRange"] = 5
+    elif header["ADRange"] == 2 * 16 or header["ADRange"] == 1:
+        header["ADRange"] = 2
+    else:
+        print("!!!CAUTION!!!/n")
+        print(f"{fname}: ADRange: {header['ADRange']}")
+
+    header["numberChannels"] = 2 if header["dataTypeCh2"] else 1
+    if frame_headers:
+        frames = count_frames(fname, header)
+        header.update(read_frame_headers(fname, header, 0, frames))
+    return header
+
+
+def count_frames(fname, header):
+    """frames per channel held by the file
+
+    a file still being recorded may hold fewer than numberFramesCurrent; with
+    two channels all Ch2 frames follow the numberFramesCurrent Ch1 ones
+    """
+    frames_current = int(header["numberFramesCurrent"])
+    frame_size = frame_dtype(header).itemsize
+    frame_count = (path.getsize(fname) - header["dataOffset"]) // frame_size
+    frame_count -= (header["numberChannels"] - 1) * frames_current
+    return max(0, min(frames_current, frame_count))
+
+
+def read_frame_headers(fname, header, start, stop):
+    """AFM data per frame of frames start:stop, as arrays
+
+    read through a strided memmap, so the image data is never touched
+    """
+    frame = frame_dtype(header)
+    if stop > start:
+        frame_headers = np.memmap(
+            fname,
+            dtype=np.dtype(
+                {
+                    "names": ["header"],
+                    "formats": [FRAME_HEADER],
+                    "itemsize": frame.itemsize,
+                }
+            ),
+            mode="r",
+            offset=header["dataOffset"] + start * frame.itemsize,
+            shape=(stop - start,),
+        )["header"]
+    else:
+        frame_headers = np.zeros(0, dtype=FRAME_HEADER)
+    return {name: np.array(frame_headers[name]) for name in FRAME_HEADER.names}
+
+
+def to_height(voltage, scale, out=None, chunk=64, zero_min=True):
+    """convert raw voltages (frames, y, x) to height (nm) (frames, y-1, x-1)
+
+    each frame is flipped upside-down, cropped, multiplied by -scale and
+    shifted to a zero minimum (unless zero_min is False); the work is done
+    chunk by chunk straight into out, so peak memory is about one output array
+    """
+    frames, y_pixel, x_pixel = voltage.shape
+    if out is None:
+        out = np.empty((frames, y_pixel - 1, x_pixel - 1), dtype="float32")
+    factor = np.float32(-scale)
+
+    for start in range(0, frames, chunk):
+        v = voltage[start : start + chunk]
+        o = out[start : start + chunk]
+        # flip upside-down, then crop [:-1, 1:] (2023-05-08: for HS-France)
+        np.multiply(v[:, :0:-1, 1:], factor, out=o)
+        if not zero_min:
+            continue
+        # minimum of the whole frame, before cropping
+        extreme = v.max((1, 2)) if factor < 0 else v.min((1, 2))
+        o -= (factor * extreme.astype("float32"))[:, None, None]
+    return out
+
+
+STORAGE = {"float32": 4, "float16": 2, "uint16": 2}  # bytes per pixel in memory
+
+
+class StoredStack(LazyStack):
+    """a decoded channel kept in memory in a compact form
+
+    float32 frames are only made for the displayed or exported slice. With
+    offset=None data is the height rounded to float16, otherwise data holds
+    the raw u2 voltages and a frame is data * -scale - offset, flipped and
+    cropped as by to_height
+    """
+
+    def __init__(self, data, frame_shape, scale=None, offset=None):
+        self.data = data
+        self.scale = scale
+        self.offset = offset
+        super().__init__(
+            lambda index: self.frames(np.array([index]))[0],
+            len(data),
+            frame_shape,
+            get_frames=self.frames,
+        )
+
+    def frames(self, index):
+        data = self.data[index]
+        if self.offset is None:
+            return data.astype("float32")
+        out = np.multiply(data[:, :0:-1, 1:], np.float32(-self.scale), dtype="float32")
+        out -= self.offset[index][:, None, None]
+        return out
+
+    @property
+    def nbytes(self):
+        """bytes held in memory, not the size of the float32 stack"""
+        return self.data.nbytes + (0 if self.offset is None else self.offset.nbytes)
+
+
+def decoded(stack):
+    """True unless stack is a LazyStack deriving frames from the voltages"""
+    return not isinstance(stack, LazyStack) or isinstance(
+        stack, (StoredStack, ConcatStack)
+    )
+
+
+def in_memory(stack):
+    """bytes of stack held in memory, mapped and lazy frames are free"""
+    if isinstance(stack, ConcatStack):
+        return sum(in_memory(part) for part in stack.parts)
+    if isinstance(stack, StoredStack):
+        return stack.nbytes
+    if isinstance(stack, np.ndarray) and not isinstance(stack, np.memmap):
+        return stack.nbytes
+    return 0
+
+
+def append_frames(buffer, length, new):
+    """buffer holding length frames with new written after them
+
+    a full buffer is replaced by one of twice the needed capacity, so
+    appending costs the new frames only, amortized
+    """
+    stop = length + len(new)
+    if buffer is None or stop > len(buffer):
+        grown = np.empty((2 * stop,) + new.shape[1:], dtype=new.dtype)
+        if buffer is not None:
+            grown[:length] = buffer[:length]
+        buffer = grown
+    buffer[length:stop] = new
+    return buffer
 
 
 class HSAFM:
-    """read asd file into np.array"""
+    """read asd file into np.array
 
-    def __init__(self, fname):
+    the raw u2 frames are always mapped with np.memmap (voltage); height is
+    converted in one pass, or with mmap=True it is a LazyStack whose frames
+    are derived on demand. channels holds one stack per recorded channel,
+    height (nm) first, then e.g. phase or error signal (V). storage "float16"
+    or "uint16" (raw voltages with a per-frame offset) decodes into a
+    StoredStack of half the size of float32
+    """
+
+    def __init__(self, fname, mmap=False, cache=None, storage="float32"):
 
         self.fullName = fname  # full name
-        with open(self.fullName) as f:
-            self.fileVersion = np.fromfile(f, "i", 1)[0]
-            self.fileHeaderSize = np.fromfile(f, "i", 1)[0]
-            self.frameHeaderSize = np.fromfile(f, "i", 1)[0]
-            self.encNumber = np.fromfile(f, "i", 1)[0]
-            self.operationNameSize = np.fromfile(f, "i", 1)[0]
-            self.commentSize = np.fromfile(f, "i", 1)[0]
-
-            # 2023-04-17 debug for commentSize
-            #----------------------------------------
-            self.commentSize -= 2
-            #========================================
-
-            self.dataTypeCh1 = np.fromfile(f, "i", 1)[0]
-            self.dataTypeCh2 = np.fromfile(f, "i", 1)[0]
-            self.numberFramesRecorded = np.fromfile(f, "i", 1)[0]
-            self.numberFramesCurrent = np.fromfile(f, "i", 1)[0]
-            self.scanDirection = np.fromfile(f, "i", 1)[0]
-            self.fileName = np.fromfile(f, "i", 1)[0]
-            self.xPixel = np.fromfile(f, "i", 1)[0]
-            self.yPixel = np.fromfile(f, "i", 1)[0]
-            self.xScanRange = np.fromfile(f, "i", 1)[0]
-            self.yScanRange = np.fromfile(f, "i", 1)[0]
-            self.avgFlag = np.fromfile(f, "?", 1)[0]
-            self.avgNumber = np.fromfile(f, "i", 1)[0]
-            self.yearRec = np.fromfile(f, "i", 1)[0]
-            self.monthRec = np.fromfile(f, "i", 1)[0]
-            self.dayRec = np.fromfile(f, "i", 1)[0]
-            self.hourRec = np.fromfile(f, "i", 1)[0]
-            self.minuteRec = np.fromfile(f, "i", 1)[0]
-            self.secondRec = np.fromfile(f, "i", 1)[0]
-            self.xRoundDeg = np.fromfile(f, "i", 1)[0]
-            self.yRoundDeg = np.fromfile(f, "i", 1)[0]
-            self.frameAcqTime = np.fromfile(f, "f", 1)[0]
-            self.sensorSens = np.fromfile(f, "f", 1)[0]
-            self.phaseSens = np.fromfile(f, "f", 1)[0]
-            self.offset = np.fromfile(f, "i", 4)  # booked region of 12 bytes
-            self.machineNum = np.fromfile(f, "i", 1)[0]
-
-            # ADRange
-            self.ADRange = np.fromfile(f, "i", 1)[0]
-            if self.ADRange == 2 ** 18 or self.ADRange == 3:
-                self.ADRange = 10
-            elif self.ADRange == 2 ** 17 or self.ADRange == 2:
-                self.ADRange = 5
-            elif self.ADRange == 2 * 16 or self.ADRange == 1:
-                self.ADRange = 2
+        self.mmap = mmap
+        if storage not in STORAGE:
+            raise ValueError(f"unknown storage {storage!r}")
+        self.storage = storage
+        for key, value in read_header(self.fullName).items():
+            setattr(self, key, value)
+
+        self.zScale = self.zPizeoConstant * self.zDriveGain * self.ADRange / 4096
+
+        self.dataTypes = [self.dataTypeCh1, self.dataTypeCh2][: self.numberChannels]
+
+        self._map_frames()
+        self._stats = None
+        self._tails = {}  # tail buffers of decoded channels, see _append
+        self.channels = self._lazy_channels()
+        if cache is not None:
+            cached = cache.get(self.fullName)
+            if cached is not None:
+                self.channels[0] = cached  # converted once, only mapped now
+        self.height = self.channels[0]
+        if not mmap:
+            for _ in self.load(cache=cache):
+                pass
+
+    def _map_frames(self):
+        dtype = frame_dtype(self.__dict__)
+        self.channelFrames = []
+        for channel in range(self.numberChannels):
+            if len(self.frameNumber):
+                frames = np.memmap(
+                    self.fullName,
+                    dtype=dtype,
+                    mode="r",
+                    # int: header fields are int32, files can exceed 2 GB
+                    offset=int(self.dataOffset)
+                    + channel * int(self.numberFramesCurrent) * dtype.itemsize,
+                    shape=(len(self.frameNumber),),
+                )
             else:
-                print("!!!CAUTION!!!/n")
-                print(f"{self.fullName}: ADRange: {self.ADRange}")
-            self.ADResolution = np.fromfile(f, "i", 1)[0]
-
-            self.xMaxScanRange = np.fromfile(f, "f", 1)[0]  # nm
-            self.yMaxScanRange = np.fromfile(f, "f", 1)[0]  # nm
-            self.xPizeoConstant = np.fromfile(f, "f", 1)[0]  # nm/V
-            self.yPizeoConstant = np.fromfile(f, "f", 1)[0]  # nm/V
-            self.zPizeoConstant = np.fromfile(f, "f", 1)[0]  # nm/V
-            self.zDriveGain = np.fromfile(f, "f", 1)[0]
-            self.operatorName = np.fromfile(f, "c", self.operationNameSize)
-            self.comment = np.fromfile(f, "c", self.commentSize)
-
-            # decode binary string
-            self.operatorName = "".join(
-                letter.decode("UTF-8") for letter in self.operatorName
+                frames = np.zeros(0, dtype=dtype)
+            self.channelFrames.append(frames)
+        self.frames = self.channelFrames[0]
+        # raw, not flipped
+        self.channelVoltage = [frames["voltage"] for frames in self.channelFrames]
+        self.voltage = self.channelVoltage[0]
+
+    def _lazy_channels(self):
+        return [
+            LazyStack(
+                partial(self.channel_frame, channel),
+                len(self.frameNumber),
+                (self.yPixel - 1, self.xPixel - 1),
             )
-            self.comment = "".join(letter.decode("UTF-8") for letter in self.comment)
-
-            # AFM data per frame
-            self.voltage = []
-            self.frameNumber = []
-            self.frameMaxData = []
-            self.frameMinData = []
-            self.xOffset = []
-            self.dataType = []
-            self.xTilt = []
-            self.yTilt = []
-            self.laserFlag = []
-
-            for _ in np.arange(self.numberFramesCurrent):
-                self.frameNumber.extend(np.fromfile(f, "i", 1))
-                self.frameMaxData.extend(np.fromfile(f, "u2", 1))
-                self.frameMinData.extend(np.fromfile(f, "u2", 1))
-                self.xOffset.extend(np.fromfile(f, "u2", 1))
-                self.dataType.extend(np.fromfile(f, "u2", 1))
-                self.xTilt.extend(np.fromfile(f, "f", 1))
-                self.yTilt.extend(np.fromfile(f, "f", 1))
-                self.laserFlag.extend(np.fromfile(f, "?", 12))
-
-                voltage_temp = np.fromfile(f, "u2", self.xPixel * self.yPixel)
-                voltage_temp = np.reshape(voltage_temp, (self.yPixel, self.xPixel))
-                voltage_temp = voltage_temp[::-1][:]  # flip image upside-down
-                self.voltage.append(voltage_temp)
-            del voltage_temp
-
-            self.voltage = np.array(self.voltage, dtype="float32")
-            self.height = (
-                -1
-                * self.voltage
-                * self.zPizeoConstant
-                * self.zDriveGain
-                * self.ADRange
-                / 4096
+            for channel in range(self.numberChannels)
+        ]
+
+    def refresh(self):
+        """pick up frames appended to a file that is still being recorded
+
+        only the file header and the new frame headers are read and the file
+        is mapped again; lazy channels become new LazyStacks, decoded stacks
+        get the new frames converted and appended, see _append. Returns the
+        number of new frames
+        """
+        with open(self.fullName, "rb") as f:
+            record = np.fromfile(f, FILE_HEADER, 1)[0]
+        self.numberFramesRecorded = record["numberFramesRecorded"]
+        self.numberFramesCurrent = record["numberFramesCurrent"]
+
+        start = len(self.frameNumber)
+        stop = count_frames(self.fullName, self.__dict__)
+        if stop <= start:
+            return 0
+        for name, values in read_frame_headers(
+            self.fullName, self.__dict__, start, stop
+        ).items():
+            setattr(self, name, np.concatenate([getattr(self, name), values]))
+
+        self._map_frames()
+        lazy = self._lazy_channels()
+        for channel in range(self.numberChannels):
+            if decoded(self.channels[channel]):
+                self.channels[channel] = self._append(channel, start, stop)
+            else:
+                self.channels[channel] = lazy[channel]
+        self.height = self.channels[0]
+        if self._stats is not None:
+            new = stack_stats(self.height[start:stop])
+            self._stats = concatenate_stats([self._stats, new])
+        return stop - start
+
+    def _append(self, channel, start, stop):
+        """a decoded channel with the frames start:stop appended
+
+        the decoded or mapped stack is kept as it is, never copied, and the
+        new frames go into a tail buffer with spare capacity, so a refresh
+        costs the new frames only
+        """
+        stack = self.channels[channel]
+        if isinstance(stack, ConcatStack):
+            prefix = stack.parts[0]
+            data, offset = self._tails[channel]
+        else:
+            prefix, data, offset = stack, None, None
+        length = start - len(prefix)  # frames already in the tail
+        scale, zero_min = self._channel_scale(channel)
+        if isinstance(prefix, StoredStack):
+            new, new_offset = self._store(channel, start, stop)
+        else:
+            voltage = self.channelVoltage[channel][start:stop]
+            new, new_offset = to_height(voltage, scale, zero_min=zero_min), None
+        data = append_frames(data, length, new)
+        if new_offset is not None:
+            offset = append_frames(offset, length, new_offset)
+        self._tails[channel] = data, offset
+
+        length += stop - start
+        tail = data[:length]
+        if isinstance(prefix, StoredStack):
+            tail = StoredStack(
+                tail,
+                prefix.shape[1:],
+                prefix.scale,
+                None if offset is None else offset[:length],
             )
-            self.height -= np.repeat(
-                np.min(self.height, (1, 2)), self.yPixel * self.xPixel
-            ).reshape((self.numberFramesCurrent, self.yPixel, self.xPixel))
-
-            # 2023-05-08: for HS-France
-            #----------------------------------------
-            height_ = np.zeros((self.height.shape[0], self.height.shape[1]-1, self.height.shape[2]-1), dtype='float32')
-            for i, img in enumerate(self.height):
-                height_[i] = img[:-1,1:]
-            self.height = height_
-            #========================================
-
-        self.afm_lut = Colormap(
-            # RGB
-            [
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0, 0, 0],
-                [0.00392156862745098, 0, 0],
-                [0.00784313725490196, 0, 0],
-                [0.0156862745098039, 0, 0],
-                [0.0156862745098039, 0, 0],
-                [0.0196078431372549, 0, 0],
-                [0.0235294117647059, 0, 0],
-                [0.0274509803921569, 0, 0],
-                [0.0313725490196078, 0, 0],
-                [0.0352941176470588, 0, 0],
-                [0.0392156862745098, 0, 0],
-                [0.0470588235294118, 0, 0],
-                [0.0509803921568627, 0, 0],
-                [0.0549019607843137, 0, 0],
-                [0.0588235294117647, 0, 0],
-                [0.0627450980392157, 0, 0],
-                [0.0666666666666667, 0, 0],
-                [0.0705882352941177, 0, 0],
-                [0.0745098039215686, 0, 0],
-                [0.0823529411764706, 0, 0],
-                [0.0862745098039216, 0, 0],
-                [0.0901960784313726, 0, 0],
-                [0.0901960784313726, 0, 0],
-                [0.0941176470588235, 0, 0],
-                [0.0980392156862745, 0, 0],
-                [0.101960784313725, 0, 0],
-                [0.105882352941176, 0, 0],
-                [0.113725490196078, 0, 0],
-                [0.117647058823529, 0, 0],
-                [0.121568627450980, 0, 0],
-                [0.125490196078431, 0, 0],
-                [0.129411764705882, 0, 0],
-                [0.133333333333333, 0, 0],
-                [0.137254901960784, 0, 0],
-                [0.141176470588235, 0, 0],
-                [0.149019607843137, 0, 0],
-                [0.152941176470588, 0, 0],
-                [0.156862745098039, 0, 0],
-                [0.160784313725490, 0, 0],
-                [0.164705882352941, 0, 0],
-                [0.164705882352941, 0, 0],
-                [0.168627450980392, 0, 0],
-                [0.172549019607843, 0, 0],
-                [0.180392156862745, 0, 0],
-                [0.184313725490196, 0, 0],
-                [0.188235294117647, 0, 0],
-                [0.192156862745098, 0, 0],
-                [0.196078431372549, 0, 0],
-                [0.200000000000000, 0, 0],
-                [0.203921568627451, 0, 0],
-                [0.207843137254902, 0, 0],
-                [0.215686274509804, 0, 0],
-                [0.219607843137255, 0, 0],
-                [0.223529411764706, 0, 0],
-                [0.227450980392157, 0, 0],
-                [0.231372549019608, 0, 0],
-                [0.235294117647059, 0, 0],
-                [0.239215686274510, 0, 0],
-                [0.239215686274510, 0, 0],
-                [0.247058823529412, 0, 0],
-                [0.250980392156863, 0, 0],
-                [0.254901960784314, 0, 0],
-                [0.258823529411765, 0, 0],
-                [0.262745098039216, 0, 0],
-                [0.266666666666667, 0, 0],
-                [0.270588235294118, 0, 0],
-                [0.274509803921569, 0, 0],
-                [0.282352941176471, 0, 0],
-                [0.286274509803922, 0, 0],
-                [0.290196078431373, 0, 0],
-                [0.294117647058824, 0, 0],
-                [0.298039215686275, 0, 0],
-                [0.301960784313725, 0, 0],
-                [0.305882352941177, 0, 0],
-                [0.313725490196078, 0, 0],
-                [0.317647058823529, 0, 0],
-                [0.317647058823529, 0, 0],
-                [0.321568627450980, 0, 0],
-                [0.325490196078431, 0, 0],
-                [0.329411764705882, 0, 0],
-                [0.333333333333333, 0, 0],
-                [0.337254901960784, 0, 0],
-                [0.341176470588235, 0.00392156862745098, 0],
-                [0.349019607843137, 0.0117647058823529, 0],
-                [0.352941176470588, 0.0196078431372549, 0],
-                [0.356862745098039, 0.0274509803921569, 0],
-                [0.360784313725490, 0.0313725490196078, 0],
-                [0.364705882352941, 0.0392156862745098, 0],
-                [0.368627450980392, 0.0470588235294118, 0],
-                [0.372549019607843, 0.0549019607843137, 0],
-                [0.376470588235294, 0.0588235294117647, 0],
-                [0.384313725490196, 0.0666666666666667, 0],
-                [0.388235294117647, 0.0745098039215686, 0],
-                [0.392156862745098, 0.0823529411764706, 0],
-                [0.392156862745098, 0.0823529411764706, 0],
-                [0.396078431372549, 0.0862745098039216, 0],
-                [0.400000000000000, 0.0941176470588235, 0],
-                [0.403921568627451, 0.101960784313725, 0],
-                [0.407843137254902, 0.109803921568627, 0],
-                [0.415686274509804, 0.113725490196078, 0],
-                [0.419607843137255, 0.121568627450980, 0],
-                [0.423529411764706, 0.129411764705882, 0],
-                [0.427450980392157, 0.133333333333333, 0],
-                [0.431372549019608, 0.141176470588235, 0],
-                [0.435294117647059, 0.149019607843137, 0],
-                [0.439215686274510, 0.156862745098039, 0],
-                [0.443137254901961, 0.160784313725490, 0],
-                [0.450980392156863, 0.168627450980392, 0],
-                [0.454901960784314, 0.176470588235294, 0],
-                [0.458823529411765, 0.184313725490196, 0],
-                [0.462745098039216, 0.188235294117647, 0],
-                [0.466666666666667, 0.196078431372549, 0],
-                [0.466666666666667, 0.196078431372549, 0],
-                [0.470588235294118, 0.203921568627451, 0],
-                [0.474509803921569, 0.211764705882353, 0],
-                [0.482352941176471, 0.215686274509804, 0],
-                [0.486274509803922, 0.223529411764706, 0],
-                [0.490196078431373, 0.231372549019608, 0],
-                [0.494117647058824, 0.235294117647059, 0],
-                [0.498039215686275, 0.243137254901961, 0],
-                [0.501960784313726, 0.250980392156863, 0],
-                [0.505882352941176, 0.258823529411765, 0],
-                [0.509803921568627, 0.262745098039216, 0],
-                [0.517647058823530, 0.270588235294118, 0],
-                [0.521568627450980, 0.278431372549020, 0],
-                [0.525490196078431, 0.286274509803922, 0],
-                [0.529411764705882, 0.290196078431373, 0],
-                [0.533333333333333, 0.298039215686275, 0],
-                [0.537254901960784, 0.305882352941177, 0],
-                [0.541176470588235, 0.313725490196078, 0],
-                [0.541176470588235, 0.313725490196078, 0],
-                [0.549019607843137, 0.317647058823529, 0],
-                [0.552941176470588, 0.325490196078431, 0],
-                [0.556862745098039, 0.333333333333333, 0],
-                [0.560784313725490, 0.337254901960784, 0],
-                [0.564705882352941, 0.345098039215686, 0],
-                [0.568627450980392, 0.352941176470588, 0],
-                [0.572549019607843, 0.360784313725490, 0],
-                [0.576470588235294, 0.364705882352941, 0],
-                [0.584313725490196, 0.372549019607843, 0],
-                [0.588235294117647, 0.380392156862745, 0],
-                [0.592156862745098, 0.388235294117647, 0],
-                [0.596078431372549, 0.392156862745098, 0],
-                [0.600000000000000, 0.400000000000000, 0],
-                [0.603921568627451, 0.407843137254902, 0],
-                [0.607843137254902, 0.415686274509804, 0],
-                [0.615686274509804, 0.419607843137255, 0],
-                [0.619607843137255, 0.427450980392157, 0],
-                [0.619607843137255, 0.427450980392157, 0],
-                [0.623529411764706, 0.435294117647059, 0],
-                [0.627450980392157, 0.439215686274510, 0],
-                [0.631372549019608, 0.447058823529412, 0.00784313725490196],
-                [0.635294117647059, 0.454901960784314, 0.0235294117647059],
-                [0.639215686274510, 0.462745098039216, 0.0352941176470588],
-                [0.643137254901961, 0.466666666666667, 0.0470588235294118],
-                [0.650980392156863, 0.474509803921569, 0.0588235294117647],
-                [0.654901960784314, 0.482352941176471, 0.0705882352941177],
-                [0.658823529411765, 0.490196078431373, 0.0823529411764706],
-                [0.662745098039216, 0.494117647058824, 0.0941176470588235],
-                [0.666666666666667, 0.501960784313726, 0.105882352941176],
-                [0.670588235294118, 0.509803921568627, 0.117647058823529],
-                [0.674509803921569, 0.517647058823530, 0.129411764705882],
-                [0.678431372549020, 0.521568627450980, 0.141176470588235],
-                [0.686274509803922, 0.529411764705882, 0.156862745098039],
-                [0.690196078431373, 0.537254901960784, 0.168627450980392],
-                [0.694117647058824, 0.545098039215686, 0.180392156862745],
-                [0.694117647058824, 0.545098039215686, 0.180392156862745],
-                [0.698039215686275, 0.549019607843137, 0.192156862745098],
-                [0.701960784313725, 0.556862745098039, 0.203921568627451],
-                [0.705882352941177, 0.564705882352941, 0.215686274509804],
-                [0.709803921568628, 0.568627450980392, 0.227450980392157],
-                [0.717647058823529, 0.576470588235294, 0.239215686274510],
-                [0.721568627450980, 0.584313725490196, 0.250980392156863],
-                [0.725490196078431, 0.592156862745098, 0.262745098039216],
-                [0.729411764705882, 0.596078431372549, 0.274509803921569],
-                [0.733333333333333, 0.603921568627451, 0.290196078431373],
-                [0.737254901960784, 0.611764705882353, 0.301960784313725],
-                [0.741176470588235, 0.619607843137255, 0.313725490196078],
-                [0.745098039215686, 0.623529411764706, 0.325490196078431],
-                [0.752941176470588, 0.631372549019608, 0.337254901960784],
-                [0.756862745098039, 0.639215686274510, 0.349019607843137],
-                [0.760784313725490, 0.647058823529412, 0.360784313725490],
-                [0.764705882352941, 0.650980392156863, 0.372549019607843],
-                [0.768627450980392, 0.658823529411765, 0.384313725490196],
-                [0.768627450980392, 0.658823529411765, 0.384313725490196],
-                [0.772549019607843, 0.666666666666667, 0.396078431372549],
-                [0.776470588235294, 0.670588235294118, 0.407843137254902],
-                [0.784313725490196, 0.678431372549020, 0.423529411764706],
-                [0.788235294117647, 0.686274509803922, 0.435294117647059],
-                [0.792156862745098, 0.694117647058824, 0.447058823529412],
-                [0.796078431372549, 0.698039215686275, 0.458823529411765],
-                [0.800000000000000, 0.705882352941177, 0.470588235294118],
-                [0.803921568627451, 0.713725490196078, 0.482352941176471],
-                [0.807843137254902, 0.721568627450980, 0.494117647058824],
-                [0.811764705882353, 0.725490196078431, 0.505882352941176],
-                [0.819607843137255, 0.733333333333333, 0.517647058823530],
-                [0.823529411764706, 0.741176470588235, 0.529411764705882],
-                [0.827450980392157, 0.749019607843137, 0.541176470588235],
-                [0.831372549019608, 0.752941176470588, 0.552941176470588],
-                [0.835294117647059, 0.760784313725490, 0.568627450980392],
-                [0.839215686274510, 0.768627450980392, 0.580392156862745],
-                [0.843137254901961, 0.772549019607843, 0.592156862745098],
-                [0.843137254901961, 0.772549019607843, 0.592156862745098],
-                [0.850980392156863, 0.780392156862745, 0.603921568627451],
-                [0.854901960784314, 0.788235294117647, 0.615686274509804],
-                [0.858823529411765, 0.796078431372549, 0.627450980392157],
-                [0.862745098039216, 0.800000000000000, 0.639215686274510],
-                [0.866666666666667, 0.807843137254902, 0.650980392156863],
-                [0.870588235294118, 0.815686274509804, 0.662745098039216],
-                [0.874509803921569, 0.823529411764706, 0.674509803921569],
-                [0.878431372549020, 0.827450980392157, 0.686274509803922],
-                [0.886274509803922, 0.835294117647059, 0.701960784313725],
-                [0.890196078431373, 0.843137254901961, 0.713725490196078],
-                [0.894117647058824, 0.850980392156863, 0.725490196078431],
-                [0.898039215686275, 0.854901960784314, 0.737254901960784],
-                [0.901960784313726, 0.862745098039216, 0.749019607843137],
-                [0.905882352941177, 0.870588235294118, 0.760784313725490],
-                [0.909803921568627, 0.874509803921569, 0.772549019607843],
-                [0.917647058823529, 0.882352941176471, 0.784313725490196],
-                [0.921568627450980, 0.890196078431373, 0.796078431372549],
-                [0.921568627450980, 0.890196078431373, 0.796078431372549],
-                [0.925490196078431, 0.898039215686275, 0.807843137254902],
-                [0.929411764705882, 0.901960784313726, 0.819607843137255],
-                [0.933333333333333, 0.909803921568627, 0.835294117647059],
-                [0.937254901960784, 0.917647058823529, 0.847058823529412],
-                [0.941176470588235, 0.925490196078431, 0.858823529411765],
-                [0.945098039215686, 0.929411764705882, 0.870588235294118],
-                [0.952941176470588, 0.937254901960784, 0.882352941176471],
-                [0.956862745098039, 0.945098039215686, 0.894117647058824],
-                [0.960784313725490, 0.952941176470588, 0.905882352941177],
-                [0.964705882352941, 0.956862745098039, 0.917647058823529],
-                [0.968627450980392, 0.964705882352941, 0.929411764705882],
-                [0.972549019607843, 0.972549019607843, 0.941176470588235],
-                [0.976470588235294, 0.976470588235294, 0.952941176470588],
-                [0.980392156862745, 0.984313725490196, 0.964705882352941],
-                [0.988235294117647, 0.992156862745098, 0.980392156862745],
-                [0.992156862745098, 1, 0.992156862745098],
-            ]
-        )
+        return ConcatStack([prefix, tail])
+
+    def _channel_scale(self, channel):
+        """to_height scale and zero_min of a channel
+
+        the first channel and topography channels are heights in nm, other
+        signals are kept in V
+        """
+        if channel == 0 or DATA_TYPES.get(self.dataTypes[channel]) == "topography":
+            return self.zScale, True
+        return self.ADRange / 4096, False
+
+    def _store(self, channel, start, stop):
+        """frames start:stop of a channel as (data, offset) for StoredStack"""
+        voltage = self.channelVoltage[channel][start:stop]
+        scale, zero_min = self._channel_scale(channel)
+        if self.storage == "float16":
+            return to_height(voltage, scale, zero_min=zero_min).astype("float16"), None
+        factor = np.float32(-scale)
+        if zero_min:  # as in to_height, the extreme of the uncropped frame
+            extreme = voltage.max((1, 2)) if factor < 0 else voltage.min((1, 2))
+            offset = factor * extreme.astype("float32")
+        else:
+            offset = np.zeros(len(voltage), dtype="float32")
+        return np.array(voltage), offset
+
+    def _stored_stack(self, channel, parts):
+        data = np.concatenate([data for data, _ in parts])
+        offset = None
+        if self.storage == "uint16":
+            offset = np.concatenate([offset for _, offset in parts])
+        scale, _ = self._channel_scale(channel)
+        return StoredStack(data, (self.yPixel - 1, self.xPixel - 1), scale, offset)
+
+    def channel_name(self, channel):
+        if channel == 0 or DATA_TYPES.get(self.dataTypes[channel]) == "topography":
+            return "height (nm)" if channel == 0 else f"height Ch{channel + 1} (nm)"
+        return f"{DATA_TYPES.get(self.dataTypes[channel], 'signal')} (V)"
+
+    def load(self, chunk=64, cache=None):
+        """decode the lazy channels into memory, channel after channel
+
+        a generator yielding the number of frames decoded so far (over all
+        channels), so callers can report progress or stop early; channels are
+        only replaced once the last frame is converted. With a HeightCache
+        the height stack is converted into the cache and mapped from there.
+        The per-frame stats of the height are taken in the same pass
+        """
+        channels = list(self.channels)
+        stats = []
+        done = 0
+        for channel, voltage in enumerate(self.channelVoltage):
+            if decoded(channels[channel]):
+                done += len(voltage)
+                continue
+            if channel == 0 and cache is not None and cache.accepts(self.height.shape):
+                for stop in cache.write(self, chunk):
+                    yield done + stop
+                channels[0] = cache.get(self.fullName)
+                done += len(voltage)
+                continue
+            if self.storage != "float32":
+                parts = []
+                for start in range(0, len(voltage), chunk):
+                    stop = min(start + chunk, len(voltage))
+                    parts.append(self._store(channel, start, stop))
+                    if channel == 0:
+                        stats.append(frame_stats(self._stored_stack(0, parts[-1:])[:]))
+                    yield done + stop
+                done += len(voltage)
+                channels[channel] = self._stored_stack(channel, parts)
+                continue
+            scale, zero_min = self._channel_scale(channel)
+            stack = np.empty(channels[channel].shape, dtype="float32")
+            for start in range(0, len(stack), chunk):
+                stop = min(start + chunk, len(stack))
+                to_height(
+                    voltage[start:stop], scale, stack[start:stop], zero_min=zero_min
+                )
+                if channel == 0:
+                    stats.append(frame_stats(stack[start:stop]))
+                yield done + stop
+            done += len(stack)
+            channels[channel] = stack
+        self.channels = channels
+        self.height = channels[0]
+        if stats and self._stats is None:
+            self._stats = concatenate_stats(stats)
+
+    @property
+    def stats(self):
+        """per-frame min, max, mean and percentiles of the height, see
+        stats.frame_stats; taken while decoding or computed once on demand"""
+        if self._stats is None:
+            self._stats = stack_stats(self.height)
+        return self._stats
+
+    @property
+    def lazy(self):
+        """True while some channel is still decoded frame by frame"""
+        return not all(decoded(stack) for stack in self.channels)
+
+    @property
+    def nbytes(self):
+        """bytes held in memory by the channel stacks, mapped data is free"""
+        return sum(in_memory(stack) for stack in self.channels)
+
+    def frame(self, index):
+        """height (nm) of one frame, computed from the raw voltage on demand"""
+        return self.channel_frame(0, index)
+
+    def channel_frame(self, channel, index):
+        """one frame of a channel, computed from the raw voltage on demand"""
+        stack = self.channels[channel]
+        if decoded(stack):
+            return stack[index]
+        scale, zero_min = self._channel_scale(channel)
+        voltage = self.channelVoltage[channel][index][None]
+        return to_height(voltage, scale, zero_min=zero_min)[0]
@@ -0,0 +1,104 @@
+import json
+from os import listdir, makedirs, path, replace, stat
+
+from .hsafm_base import count_frames, read_header
+
+INDEX_DIR = ".hsafm"  # sidecar directory inside each data directory
+INDEX_NAME = "index.json"
+DATE_FIELDS = ("yearRec", "monthRec", "dayRec", "hourRec", "minuteRec", "secondRec")
+
+
+def list_asd(directory):
+    """sorted names of the asd files in directory, without macOS ._ files"""
+    return sorted(
+        f for f in listdir(directory) if f.endswith(".asd") and not f.startswith("._")
+    )
+
+
+def summarize(fname):
+    """JSON friendly header fields of an asd file
+
+    only the file header is read, the frames are counted from the file size
+    """
+    header = read_header(fname, frame_headers=False)
+    return {
+        "date": "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
+            *(int(header[key]) for key in DATE_FIELDS)
+        ),
+        "frames": count_frames(fname, header),
+        "xPixel": int(header["xPixel"]),
+        "yPixel": int(header["yPixel"]),
+        "xScanRange": int(header["xScanRange"]),
+        "yScanRange": int(header["yScanRange"]),
+        "frameAcqTime": float(header["frameAcqTime"]),
+        "operatorName": header["operatorName"],
+        "comment": header["comment"],
+    }
+
+
+class MetadataIndex:
+    """header fields of every asd file in a directory
+
+    entries are keyed by file name and reused while the file size and mtime
+    match; the index is kept in <directory>/.hsafm/index.json so it survives
+    sessions
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fname = path.join(directory, INDEX_DIR, INDEX_NAME)
+        try:
+            with open(self.fname) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _stat(self, name):
+        st = stat(path.join(self.directory, name))
+        return st.st_size, st.st_mtime
+
+    def get(self, name):
+        """indexed entry of name, None if missing or out of date"""
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        try:
+            size, mtime = self._stat(name)
+        except OSError:
+            return None
+        if entry["size"] != size or entry["mtime"] != mtime:
+            return None
+        return entry
+
+    def update(self, name):
+        size, mtime = self._stat(name)
+        try:
+            entry = summarize(path.join(self.directory, name))
+        except (OSError, ValueError, IndexError) as e:
+            entry = {"error": str(e)}
+        entry.update(size=size, mtime=mtime)
+        self.entries[name] = entry
+        return entry
+
+    def build(self):
+        """index new or modified files, yields (name, entry) as it goes
+
+        entries of files that left the directory are dropped; call save()
+        afterwards to keep the index for the next session
+        """
+        names = list_asd(self.directory)
+        for name in set(self.entries) - set(names):
+            del self.entries[name]
+        for name in names:
+            if self.get(name) is None:
+                yield name, self.update(name)
+
+    def save(self):
+        """write the index, silently skipped on read-only directories"""
+        try:
+            makedirs(path.dirname(self.fname), exist_ok=True)
+            with open(self.fname + ".tmp", "w") as f:
+                json.dump(self.entries, f)
+            replace(self.fname + ".tmp", self.fname)
+        except OSError:
+            pass
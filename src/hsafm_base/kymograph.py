@@ -0,0 +1,80 @@
+import numpy as np
+
+from .stack import LazyStack
+
+
+def line_points(start, end):
+    """(y, x) points one pixel apart from start to end, both included"""
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    count = int(np.ceil(np.hypot(*(end - start)))) + 1
+    return start + np.linspace(0, 1, count)[:, None] * (end - start)
+
+
+def bilinear(points, shape):
+    """pixels (4, points) as (rows, columns) and their bilinear weights
+
+    points outside the frame are clamped to its border
+    """
+    y = np.clip(points[:, 0], 0, shape[0] - 1)
+    x = np.clip(points[:, 1], 0, shape[1] - 1)
+    y0 = np.minimum(np.floor(y).astype(int), max(shape[0] - 2, 0))
+    x0 = np.minimum(np.floor(x).astype(int), max(shape[1] - 2, 0))
+    y1 = np.minimum(y0 + 1, shape[0] - 1)
+    x1 = np.minimum(x0 + 1, shape[1] - 1)
+    dy, dx = y - y0, x - x0
+    rows = np.stack([y0, y0, y1, y1])
+    columns = np.stack([x0, x1, x0, x1])
+    weights = np.stack([(1 - dy) * (1 - dx), (1 - dy) * dx, dy * (1 - dx), dy * dx])
+    return rows, columns, weights.astype("float32")
+
+
+def kymograph(stack, start, end, chunk=256):
+    """heights along the line start - end (y, x) in every frame of a stack
+
+    returns (frames, points); the stack is read chunk by chunk and all
+    points of a chunk are interpolated with one gather
+    """
+    points = line_points(start, end)
+    rows, columns, weights = bilinear(points, stack.shape[1:])
+    out = np.empty((len(stack), len(points)), dtype="float32")
+    for begin in range(0, len(stack), chunk):
+        frames = np.asarray(stack[begin : begin + chunk])
+        out[begin : begin + chunk] = (frames[:, rows, columns] * weights).sum(1)
+    return out
+
+
+def hsafm_kymograph(hsafm, start, end, chunk=4096):
+    """kymograph of the height of hsafm, straight from the raw voltages
+
+    while the height is not decoded only the pixels next to the line are
+    read from the mapped file, and the per-frame offset comes from the
+    frameMaxData/frameMinData headers; frames with an invalid header range
+    are read whole. Decoded or cached heights go through kymograph()
+    """
+    stack = hsafm.height
+    if type(stack) is not LazyStack:
+        return kymograph(stack, start, end)
+
+    points = line_points(start, end)
+    rows, columns, weights = bilinear(points, stack.shape[1:])
+    voltage = hsafm.voltage
+    # height[r, c] comes from voltage[yPixel - 1 - r, c + 1], see to_height
+    v_rows, v_columns = voltage.shape[1] - 1 - rows, columns + 1
+    factor = np.float32(-hsafm.zScale)
+    extreme = hsafm.frameMaxData if factor < 0 else hsafm.frameMinData
+    invalid = np.flatnonzero(hsafm.frameMaxData <= hsafm.frameMinData)
+    extreme = extreme.astype("float32")
+    # read whole, chunk by chunk, e.g. every frame when the headers are unset
+    for begin in range(0, len(invalid), chunk):
+        frames = invalid[begin : begin + chunk]
+        values = voltage[frames]
+        extreme[frames] = values.max((1, 2)) if factor < 0 else values.min((1, 2))
+
+    offset = factor * extreme
+
+    out = np.empty((len(stack), len(points)), dtype="float32")
+    for begin in range(0, len(stack), chunk):
+        stop = begin + chunk
+        raw = voltage[begin:stop][:, v_rows, v_columns]
+        out[begin:stop] = (raw * weights).sum(1) * factor - offset[begin:stop, None]
+    return out
@@ -0,0 +1,122 @@
+import numpy as np
+
+from .stack import LazyStack
+
+METHODS = ("plane", "line", "median", "tilt")
+
+
+def _coordinates(n):
+    return np.linspace(-1, 1, n) if n > 1 else np.zeros(n)
+
+
+def _plane_terms(shape, order):
+    y, x = np.meshgrid(_coordinates(shape[0]), _coordinates(shape[1]), indexing="ij")
+    terms = [
+        x.ravel() ** i * y.ravel() ** j
+        for i in range(order + 1)
+        for j in range(order + 1 - i)
+    ]
+    return np.stack(terms, 1)
+
+
+def remove_plane(frames, order=1):
+    """subtract the least squares plane (or surface of order) of every frame
+
+    one pseudo-inverse of the design matrix is shared by all frames, so the
+    fit of a whole (frames, y, x) batch is two matrix products
+    """
+    n, y, x = frames.shape
+    terms = _plane_terms((y, x), order)
+    flat = frames.reshape(n, -1)
+    coefficients = flat @ np.linalg.pinv(terms).T.astype(frames.dtype)
+    return (flat - coefficients @ terms.T.astype(frames.dtype)).reshape(n, y, x)
+
+
+def remove_lines(frames, order=1):
+    """subtract a polynomial of order fitted to every scan line (along x)"""
+    terms = np.vander(_coordinates(frames.shape[2]), order + 1)
+    coefficients = frames @ np.linalg.pinv(terms).T.astype(frames.dtype)
+    return frames - coefficients @ terms.T.astype(frames.dtype)
+
+
+def remove_line_median(frames):
+    """subtract the median of every scan line"""
+    return frames - np.median(frames, axis=2, keepdims=True)
+
+
+def remove_tilt(frames, x_tilt, y_tilt):
+    """subtract the planes x_tilt * x + y_tilt * y given per frame
+
+    the tilts are slopes in height per pixel of the displayed frame, e.g. the
+    header tilts through header_tilt()
+    """
+    _, y, x = frames.shape
+    x_tilt = np.asarray(x_tilt, dtype=frames.dtype)[:, None, None]
+    y_tilt = np.asarray(y_tilt, dtype=frames.dtype)[:, None, None]
+    return frames - x_tilt * np.arange(x) - y_tilt * np.arange(y)[:, None]
+
+
+def header_tilt(hsafm):
+    """xTilt and yTilt of the frame headers as slopes of the height (nm/pixel)
+
+    the header tilts are taken as slopes of the raw data per pixel of the
+    raw frame. to_height flips frames upside-down and multiplies them by
+    -zScale, so the x slope is scaled by -zScale and the y slope by +zScale
+    """
+    z_scale = np.float32(hsafm.zScale)
+    return -z_scale * hsafm.xTilt, z_scale * hsafm.yTilt
+
+
+def level_frames(frames, method="plane", order=1, tilt=None, zero_min=True):
+    """level a (frames, y, x) batch, tilt holds the (x, y) tilts of each frame"""
+    frames = np.asarray(frames, dtype="float32")
+    if method == "plane":
+        frames = remove_plane(frames, order)
+    elif method == "line":
+        frames = remove_lines(frames, order)
+    elif method == "median":
+        frames = remove_line_median(frames)
+    elif method == "tilt":
+        frames = remove_tilt(frames, *tilt)
+    else:
+        raise ValueError(f"unknown leveling method {method!r}")
+    if zero_min:
+        frames -= frames.min((1, 2), keepdims=True)
+    return frames
+
+
+def level(stack, method="plane", order=1, tilt=None, chunk=64, out=None):
+    """level a whole stack chunk by chunk, e.g. before an export
+
+    tilt is a pair of per-frame arrays (xTilt, yTilt) for method "tilt"
+    """
+    if out is None:
+        out = np.empty(stack.shape, dtype="float32")
+    for start in range(0, len(stack), chunk):
+        stop = min(start + chunk, len(stack))
+        out[start:stop] = level_frames(
+            stack[start:stop],
+            method,
+            order,
+            None if tilt is None else [t[start:stop] for t in tilt],
+        )
+    return out
+
+
+def leveled(stack, method="plane", order=1, tilt=None):
+    """lazily leveled view of stack, slices are leveled as one batch"""
+
+    def frames(index):
+        return level_frames(
+            stack[index],
+            method,
+            order,
+            None if tilt is None else [np.asarray(t)[index] for t in tilt],
+        )
+
+    return LazyStack(
+        lambda index: frames(np.array([index]))[0],
+        len(stack),
+        stack.shape[1:],
+        get_frames=frames,
+    )
@@ -0,0 +1,48 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .stack import LazyStack
+
+MIN_SIZE = 128  # no level is made whose frames would be smaller than this
+CACHED_FRAMES = 256  # frames kept per reduced level
+
+
+def block_average(frames, factor=2):
+    """average factor x factor blocks of a (frames, y, x) batch
+
+    trailing rows and columns that do not fill a block are dropped
+    """
+    frames = np.asarray(frames)
+    n, y, x = frames.shape
+    y, x = y // factor * factor, x // factor * factor
+    blocks = frames[:, :y, :x].reshape(n, y // factor, factor, x // factor, factor)
+    return blocks.mean((2, 4), dtype="float32")
+
+
+def pyramid(stack, min_size=MIN_SIZE, cached_frames=CACHED_FRAMES):
+    """stack followed by lazily 2x block averaged levels, for multiscale=True
+
+    each level is built from the one above it, frame by frame as it is
+    displayed, and keeps its last cached_frames frames, so playback at a
+    small zoom only reads the reduced frames once
+    """
+    levels = [stack]
+    while min(levels[-1].shape[1:]) // 2 >= min_size:
+        parent = levels[-1]
+
+        def frames(index, parent=parent):
+            return block_average(parent[index])
+
+        frame = lru_cache(maxsize=cached_frames)(
+            lambda index, parent=parent: block_average(parent[index][None])[0]
+        )
+        levels.append(
+            LazyStack(
+                frame,
+                len(stack),
+                (parent.shape[1] // 2, parent.shape[2] // 2),
+                get_frames=frames,
+            )
+        )
+    return levels
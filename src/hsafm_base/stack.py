@@ -0,0 +1,96 @@
+import numpy as np
+
+
+class LazyStack:
+    """read-only array-like movie whose frames are built on demand
+
+    napari only needs shape, dtype, ndim and __getitem__, so a stack handed to
+    add_image decodes the displayed frame only (one chunk per frame).
+    get_frames, if given, builds several frames from an index array at once
+    and is used for slices, e.g. chunks read by an export
+    """
+
+    def __init__(
+        self, get_frame, length, frame_shape, dtype="float32", get_frames=None
+    ):
+        self.get_frame = get_frame
+        self.get_frames = get_frames
+        self.shape = (int(length),) + tuple(int(n) for n in frame_shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"<{type(self).__name__} shape={self.shape} dtype={self.dtype}>"
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        for i, k in enumerate(key):
+            if k is Ellipsis:
+                fill = (slice(None),) * (self.ndim - len(key) + 1)
+                key = key[:i] + fill + key[i + 1 :]
+                break
+        index, rest = key[0], key[1:]
+
+        if isinstance(index, (int, np.integer)):
+            if not -len(self) <= index < len(self):
+                raise IndexError(f"frame {index} out of range for {len(self)} frames")
+            return np.asarray(self.get_frame(int(index) % len(self)))[rest]
+
+        frames = np.arange(len(self))[index]
+        if self.get_frames is not None:
+            stack = np.asarray(self.get_frames(frames), dtype=self.dtype)
+            return stack[(slice(None),) + rest]
+        stack = np.empty((len(frames),) + self.shape[1:], dtype=self.dtype)
+        for i, frame in enumerate(frames):
+            stack[i] = self.get_frame(int(frame))
+        return stack[(slice(None),) + rest]
+
+    def __array__(self, dtype=None, copy=None):
+        stack = self[:]
+        return stack if dtype is None else stack.astype(dtype)
+
+
+class ConcatStack(LazyStack):
+    """the frames of several stacks one after the other, none is copied
+
+    e.g. a decoded or memory-mapped movie followed by the frames appended
+    while it is being recorded
+    """
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.starts = np.cumsum([0] + [len(part) for part in self.parts])
+        super().__init__(
+            self.frame,
+            self.starts[-1],
+            self.parts[0].shape[1:],
+            np.result_type(*(part.dtype for part in self.parts)),
+            get_frames=self.frames,
+        )
+
+    def frame(self, index):
+        part = np.searchsorted(self.starts, index, side="right") - 1
+        return self.parts[part][index - self.starts[part]]
+
+    def frames(self, indices):
+        out = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        parts = np.searchsorted(self.starts, indices, side="right") - 1
+        for part in np.unique(parts):
+            inside = parts == part
+            out[inside] = self.parts[part][indices[inside] - self.starts[part]]
+        return out
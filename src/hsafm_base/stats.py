@@ -0,0 +1,86 @@
+import numpy as np
+
+PERCENTILES = (1, 50, 99)
+BINS = 256  # histogram bins per frame, between the frame min and max
+ROW_STEP = 4  # every ROW_STEP-th scan line is sampled for the histogram
+
+
+def frame_stats(frames, percentiles=PERCENTILES):
+    """min, max, mean, histogram and percentiles of every frame of a batch
+
+    min, max and mean are exact. The BINS-bin histograms of all frames are
+    counted with one bincount over every ROW_STEP-th scan line and the
+    percentiles read from them, which is plenty for contrast limits and
+    keeps the pass cheap next to decoding
+    """
+    frames = np.asarray(frames, dtype="float32")
+    n = len(frames)
+    low = frames.min((1, 2))
+    high = frames.max((1, 2))
+    width = np.where(high > low, (high - low) / BINS, 1).astype("float32")
+
+    sample = frames[:, ::ROW_STEP]
+    sample = sample.reshape(n, sample.shape[1] * sample.shape[2])
+    bins = ((sample - low[:, None]) / width[:, None]).astype("int32")
+    np.minimum(bins, BINS - 1, out=bins)
+    bins += (np.arange(n, dtype="int32") * BINS)[:, None]
+    histogram = np.bincount(bins.ravel(), minlength=n * BINS).reshape(n, BINS)
+
+    cumulative = histogram.cumsum(1)
+    targets = cumulative[:, -1:] * (np.asarray(percentiles) / 100)
+    index = (cumulative[:, None, :] < targets[:, :, None]).sum(2)
+    return {
+        "min": low,
+        "max": high,
+        "mean": frames.mean((1, 2), dtype="float64").astype("float32"),
+        "histogram": histogram.astype("uint32"),
+        "percentiles": low[:, None] + (index + 0.5).astype("float32") * width[:, None],
+    }
+
+
+def concatenate_stats(stats):
+    return {key: np.concatenate([s[key] for s in stats]) for key in stats[0]}
+
+
+def stack_stats(stack, chunk=64, percentiles=PERCENTILES):
+    """frame_stats of a whole stack, read chunk by chunk"""
+    stats = [frame_stats(stack[:0], percentiles)]
+    for start in range(0, len(stack), chunk):
+        stats.append(frame_stats(stack[start : start + chunk], percentiles))
+    return concatenate_stats(stats)
+
+
+def header_range(hsafm):
+    """height range (nm) of every frame from frameMaxData and frameMinData
+
+    no pixel is read; frames whose header holds no valid range are NaN. As
+    decoded frames are cropped by one line and column this is an upper bound
+    """
+    valid = hsafm.frameMaxData > hsafm.frameMinData
+    span = hsafm.frameMaxData.astype("float32") - hsafm.frameMinData
+    return np.where(valid, span * np.float32(abs(hsafm.zScale)), np.nan)
+
+
+def header_limits(hsafm, frames=None):
+    """contrast limits of the height from header_range, no pixel is read
+
+    heights start at zero in every frame, so the limits are 0 and the largest
+    range of frames (all by default); None if no frame has a valid range
+    """
+    span = header_range(hsafm)
+    if frames is not None:
+        span = span[frames]
+    if np.isnan(span).all():
+        return None
+    return 0.0, float(np.nanmax(span))
+
+
+def contrast_limits(stats):
+    """robust limits over the whole movie, from the lowest and highest
+    percentile of every frame"""
+    if not len(stats["percentiles"]):
+        return 0.0, 1.0
+    return (
+        float(stats["percentiles"][:, 0].min()),
+        float(stats["percentiles"][:, -1].max()),
+    )
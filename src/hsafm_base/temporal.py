@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .stack import LazyStack
+
+METHODS = ("mean", "median", "gaussian")
+
+
+def _half_width(method, window, sigma):
+    return int(np.ceil(3 * sigma)) if method == "gaussian" else window // 2
+
+
+def _gaussian(sigma, half):
+    weights = np.exp(-0.5 * (np.arange(-half, half + 1) / sigma) ** 2)
+    return weights.astype("float32")
+
+
+def filter_block(block, first, indices, total, method="mean", window=5, sigma=1.0):
+    """temporally filtered frames indices, from the source frames in block
+
+    block holds the source frames first:first + len(block) and must cover
+    the window of every index; total is the length of the source stack.
+    Windows are cut at the ends of the movie. Means are differences of one
+    cumulative sum over the block
+    """
+    half = _half_width(method, window, sigma)
+    indices = np.asarray(indices)
+    low = np.maximum(indices - half, 0)
+    high = np.minimum(indices + half + 1, total)
+    if method == "mean":
+        cumulative = np.zeros((len(block) + 1,) + block.shape[1:], dtype="float64")
+        np.cumsum(block, axis=0, out=cumulative[1:])
+        sums = cumulative[high - first] - cumulative[low - first]
+        return (sums / (high - low)[:, None, None]).astype("float32")
+
+    out = np.empty((len(indices),) + block.shape[1:], dtype="float32")
+    weights = _gaussian(sigma, half) if method == "gaussian" else None
+    for i, (index, lo, hi) in enumerate(zip(indices, low, high)):
+        frames = block[lo - first : hi - first]
+        if method == "median":
+            out[i] = np.median(frames, axis=0)
+        elif method == "gaussian":
+            w = weights[lo - index + half : hi - index + half]
+            out[i] = np.tensordot(w / w.sum(), frames, axes=1)
+        else:
+            raise ValueError(f"unknown temporal filter {method!r}")
+    return out
+
+
+def temporal_filter(stack, method="mean", window=5, sigma=1.0, chunk=64, out=None):
+    """filter a whole stack along time, streaming chunk by chunk
+
+    each chunk reads its frames plus the half window on either side, e.g.
+    for an export of the filtered movie
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown temporal filter {method!r}")
+    half = _half_width(method, window, sigma)
+    total = len(stack)
+    if out is None:
+        out = np.empty(stack.shape, dtype="float32")
+    for start in range(0, total, chunk):
+        stop = min(start + chunk, total)
+        first = max(start - half, 0)
+        block = np.asarray(stack[first : min(stop + half, total)], dtype="float32")
+        indices = np.arange(start, stop)
+        out[start:stop] = filter_block(
+            block, first, indices, total, method, window, sigma
+        )
+    return out
+
+
+class TemporalFilter(LazyStack):
+    """lazily filtered view of a stack, only displayed frames are computed
+
+    source frames are kept in a small LRU around the displayed one, so
+    stepping or playing reads one new frame per step; the running mean is
+    updated by adding the frame entering and subtracting the frame leaving
+    the window instead of summing the window again
+    """
+
+    def __init__(self, stack, method="mean", window=5, sigma=1.0):
+        if method not in METHODS:
+            raise ValueError(f"unknown temporal filter {method!r}")
+        self.stack = stack
+        self.method = method
+        self.window = window
+        self.sigma = sigma
+        self.half = _half_width(method, window, sigma)
+        self._sources = OrderedDict()
+        self._sum = None
+        self._range = (0, 0)
+        self._lock = threading.Lock()
+        super().__init__(
+            self.frame, len(stack), stack.shape[1:], get_frames=self.frames
+        )
+
+    def _source(self, index):
+        frame = self._sources.get(index)
+        if frame is None:
+            frame = np.asarray(self.stack[index], dtype="float32")
+            self._sources[index] = frame
+            while len(self._sources) > 2 * self.half + 4:
+                self._sources.popitem(last=False)
+        else:
+            self._sources.move_to_end(index)
+        return frame
+
+    def frames(self, indices):
+        """filter several frames at once, from one block of the source"""
+        if not len(indices):
+            return np.empty((0,) + self.shape[1:], dtype="float32")
+        first = max(int(indices.min()) - self.half, 0)
+        stop = min(int(indices.max()) + self.half + 1, len(self))
+        block = np.asarray(self.stack[first:stop], dtype="float32")
+        return filter_block(
+            block, first, indices, len(self), self.method, self.window, self.sigma
+        )
+
+    def frame(self, index):
+        low = max(index - self.half, 0)
+        high = min(index + self.half + 1, len(self))
+        with self._lock:
+            if self.method != "mean":
+                block = np.stack([self._source(i) for i in range(low, high)])
+                return filter_block(
+                    block, low, [index], len(self), self.method, self.window, self.sigma
+                )[0]
+
+            previous_low, previous_high = self._range
+            overlap = min(high, previous_high) - max(low, previous_low)
+            if self._sum is None or overlap <= 0:
+                self._sum = np.zeros(self.shape[1:], dtype="float64")
+                previous_low = previous_high = low
+            # frames leaving the window, then frames entering it
+            for i in range(previous_low, min(low, previous_high)):
+                self._sum -= self._source(i)
+            for i in range(max(high, previous_low), previous_high):
+                self._sum -= self._source(i)
+            for i in range(low, min(previous_low, high)):
+                self._sum += self._source(i)
+            for i in range(max(previous_high, low), high):
+                self._sum += self._source(i)
+            self._range = (low, high)
+            return (self._sum / (high - low)).astype("float32")
@@ -0,0 +1,165 @@
+import numpy as np
+
+# file header as it is laid out on disk, without operator name and comment
+_FILE_HEADER = np.dtype(
+    [
+        ("fileVersion", "<i4"),
+        ("fileHeaderSize", "<i4"),
+        ("frameHeaderSize", "<i4"),
+        ("encNumber", "<i4"),
+        ("operationNameSize", "<i4"),
+        ("commentSize", "<i4"),
+        ("dataTypeCh1", "<i4"),
+        ("dataTypeCh2", "<i4"),
+        ("numberFramesRecorded", "<i4"),
+        ("numberFramesCurrent", "<i4"),
+        ("scanDirection", "<i4"),
+        ("fileName", "<i4"),
+        ("xPixel", "<i4"),
+        ("yPixel", "<i4"),
+        ("xScanRange", "<i4"),
+        ("yScanRange", "<i4"),
+        ("avgFlag", "?"),
+        ("avgNumber", "<i4"),
+        ("yearRec", "<i4"),
+        ("monthRec", "<i4"),
+        ("dayRec", "<i4"),
+        ("hourRec", "<i4"),
+        ("minuteRec", "<i4"),
+        ("secondRec", "<i4"),
+        ("xRoundDeg", "<i4"),
+        ("yRoundDeg", "<i4"),
+        ("frameAcqTime", "<f4"),
+        ("sensorSens", "<f4"),
+        ("phaseSens", "<f4"),
+        ("offset", "<i4", 4),
+        ("machineNum", "<i4"),
+        ("ADRange", "<i4"),
+        ("ADResolution", "<i4"),
+        ("xMaxScanRange", "<f4"),
+        ("yMaxScanRange", "<f4"),
+        ("xPizeoConstant", "<f4"),
+        ("yPizeoConstant", "<f4"),
+        ("zPizeoConstant", "<f4"),
+        ("zDriveGain", "<f4"),
+    ]
+)
+
+_FRAME_HEADER = np.dtype(
+    [
+        ("frameNumber", "<i4"),
+        ("frameMaxData", "<u2"),
+        ("frameMinData", "<u2"),
+        ("xOffset", "<u2"),
+        ("dataType", "<u2"),
+        ("xTilt", "<f4"),
+        ("yTilt", "<f4"),
+        ("laserFlag", "?", 12),
+    ]
+)
+
+
+def make_voltage(frames=10, y_pixel=64, x_pixel=64, seed=0):
+    """random raw u2 voltages shaped (frames, y_pixel, x_pixel)"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 4096, (frames, y_pixel, x_pixel), dtype="u2")
+
+
+def write_asd(
+    fname,
+    voltage=None,
+    operator="tester",
+    comment="synthetic",
+    voltage_ch2=None,
+    **header,
+):
+    """write a synthetic asd file that HSAFM can read
+
+    voltage is the raw (frames, yPixel, xPixel) u2 data, header fields can be
+    overridden by keyword, e.g. write_asd(fname, voltage, frameAcqTime=50.0);
+    voltage_ch2 adds a phase channel stored after all frames of the first one
+    """
+    if voltage is None:
+        voltage = make_voltage()
+    voltage = np.asarray(voltage, dtype="<u2")
+    frames, y_pixel, x_pixel = voltage.shape
+    operator = operator.encode("UTF-8")
+    comment = comment.encode("UTF-8")
+
+    file_header = np.zeros((), dtype=_FILE_HEADER)
+    defaults = {
+        "fileVersion": 1,
+        "fileHeaderSize": _FILE_HEADER.itemsize + len(operator) + len(comment),
+        "frameHeaderSize": _FRAME_HEADER.itemsize,
+        "operationNameSize": len(operator),
+        "commentSize": len(comment) + 2,  # HSAFM drops the last two bytes
+        "dataTypeCh1": 0x5054,
+        "dataTypeCh2": 0 if voltage_ch2 is None else 0x4850,
+        "numberFramesRecorded": frames,
+        "numberFramesCurrent": frames,
+        "xPixel": x_pixel,
+        "yPixel": y_pixel,
+        "xScanRange": 2 * x_pixel,
+        "yScanRange": 2 * y_pixel,
+        "yearRec": 2023,
+        "monthRec": 5,
+        "dayRec": 8,
+        "hourRec": 12,
+        "minuteRec": 30,
+        "secondRec": 15,
+        "frameAcqTime": 100.0,
+        "ADRange": 2 ** 17,
+        "ADResolution": 4096,
+        "xPizeoConstant": 10.0,
+        "yPizeoConstant": 10.0,
+        "zPizeoConstant": 2.5,
+        "zDriveGain": 1.5,
+    }
+    defaults.update(header)
+    for key, value in defaults.items():
+        file_header[key] = value
+
+    frame_headers = np.zeros(frames, dtype=_FRAME_HEADER)
+    frame_headers["frameNumber"] = np.arange(frames)
+    frame_headers["frameMaxData"] = voltage.max((1, 2))
+    frame_headers["frameMinData"] = voltage.min((1, 2))
+
+    with open(fname, "wb") as f:
+        f.write(file_header.tobytes())
+        f.write(operator)
+        f.write(comment)
+        for channel in (voltage, voltage_ch2):
+            if channel is None:
+                continue
+            channel = np.asarray(channel, dtype="<u2")
+            for frame_header, frame in zip(frame_headers, channel):
+                f.write(frame_header.tobytes())
+                f.write(frame.tobytes())
+    return fname
+
+
+def write_synthetic(fname, frames, y_pixel=256, x_pixel=256, channels=1, seed=0):
+    """write a large synthetic asd file chunk by chunk, e.g. for benchmarks
+
+    only one chunk of random frames is held in memory, so movies of any size
+    can be generated; a second channel is stored after the first one
+    """
+    header = {"numberFramesRecorded": frames, "numberFramesCurrent": frames}
+    if channels > 1:
+        header["dataTypeCh2"] = 0x4850
+    write_asd(fname, make_voltage(0, y_pixel, x_pixel), **header)
+
+    chunk = max(1, 2 ** 25 // (y_pixel * x_pixel * 2))
+    with open(fname, "ab") as f:
+        for channel in range(channels):
+            for start in range(0, frames, chunk):
+                stop = min(start + chunk, frames)
+                voltage = make_voltage(stop - start, y_pixel, x_pixel, seed + start)
+                frame_headers = np.zeros(stop - start, dtype=_FRAME_HEADER)
+                frame_headers["frameNumber"] = np.arange(start, stop)
+                frame_headers["frameMaxData"] = voltage.max((1, 2))
+                frame_headers["frameMinData"] = voltage.min((1, 2))
+                for frame_header, frame in zip(frame_headers, voltage):
+                    f.write(frame_header.tobytes())
+                    f.write(frame.tobytes())
+    return fname
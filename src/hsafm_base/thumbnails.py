@@ -0,0 +1,130 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import makedirs, path, replace
+
+import numpy as np
+
+from .hsafm_base import count_frames, frame_dtype, read_header, to_height
+from .index import INDEX_DIR
+
+THUMBNAIL_DIR = "thumbnails"  # inside the metadata sidecar directory
+SIZE = 64  # longest side of each downsampled frame
+
+
+def downsample(frame, size=SIZE):
+    """block average frame so its longest side is at most size pixels"""
+    factor = max(1, -(-max(frame.shape) // size))
+    y, x = (n // factor * factor or n for n in frame.shape)
+    frame = frame[:y, :x]
+    if factor == 1 or y < factor or x < factor:
+        return frame
+    return frame.reshape(y // factor, factor, x // factor, factor).mean((1, 3))
+
+
+def keyframes(fname, size=SIZE):
+    """first, middle and last frame of an asd file as a uint8 strip
+
+    the frames are read at offsets computed from the file header only, so
+    neither the frame headers nor any other frame is touched; each frame is
+    downsampled and stretched to 0 - 255 on its own
+    """
+    header = read_header(fname, frame_headers=False)
+    frames = count_frames(fname, header)
+    if not frames:
+        raise ValueError(f"{fname}: no frames")
+    mapped = np.memmap(
+        fname,
+        dtype=frame_dtype(header),
+        mode="r",
+        offset=header["dataOffset"],
+        shape=(frames,),
+    )
+    indices = sorted({0, frames // 2, frames - 1})
+    z_scale = (
+        header["zPizeoConstant"] * header["zDriveGain"] * header["ADRange"] / 4096
+    )
+    height = to_height(mapped["voltage"][indices], z_scale)
+    strip = []
+    for frame in height:
+        frame = downsample(frame, size)
+        low, high = frame.min(), frame.max()
+        frame = (frame - low) * (255 / (high - low) if high > low else 0)
+        strip.append(frame.astype("uint8"))
+    gap = np.zeros((strip[0].shape[0], 1), dtype="uint8")
+    return np.hstack([part for frame in strip for part in (frame, gap)][:-1])
+
+
+def _write(fname, out, size):
+    """keyframes of fname, also saved to out unless it cannot be written"""
+    thumbnail = keyframes(fname, size)
+    try:
+        np.save(out + ".tmp.npy", thumbnail)
+        replace(out + ".tmp.npy", out)
+    except OSError:  # e.g. a read-only share
+        pass
+    return thumbnail
+
+
+class Thumbnails:
+    """keyframe strips of the asd files of a directory, kept as .npy files
+
+    next to the metadata index (<directory>/.hsafm/thumbnails); a strip is
+    made again when its file is newer
+    """
+
+    def __init__(self, directory, size=SIZE):
+        self.directory = directory
+        self.size = size
+        self.cache_dir = path.join(directory, INDEX_DIR, THUMBNAIL_DIR)
+
+    def path(self, name):
+        return path.join(self.cache_dir, name + ".npy")
+
+    def get(self, name):
+        """the cached strip of name, None if missing or out of date"""
+        cached = self.path(name)
+        try:
+            if path.getmtime(cached) < path.getmtime(path.join(self.directory, name)):
+                return None
+            return np.load(cached)
+        except (OSError, ValueError):
+            return None
+
+    def build(self, names, workers=None):
+        """make the missing strips in a process pool
+
+        a generator yielding (name, strip) as they are ready, cached ones
+        first; files that cannot be read are skipped, strips that cannot be
+        cached are still yielded. Workers are spawned, not forked, as the
+        caller is usually a GUI with threads running
+        """
+        missing = []
+        for name in names:
+            thumbnail = self.get(name)
+            if thumbnail is None:
+                missing.append(name)
+            else:
+                yield name, thumbnail
+        if not missing:
+            return
+        try:
+            makedirs(self.cache_dir, exist_ok=True)
+        except OSError:  # read-only directory, strips are made but not kept
+            pass
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(
+                    _write, path.join(self.directory, name), self.path(name), self.size
+                ): name
+                for name in missing
+            }
+            try:
+                for future in as_completed(futures):
+                    try:
+                        yield futures[future], future.result()
+                    except (OSError, ValueError, IndexError):
+                        continue
+            finally:  # stopped early, e.g. the directory changed
+                for future in futures:
+                    future.cancel()
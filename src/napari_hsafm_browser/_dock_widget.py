@@ -1,24 +1,175 @@
 import datetime
 import re
-from os import listdir, makedirs, path
+from concurrent.futures import wait
+from functools import lru_cache
+from os import makedirs, path
 import shutil
 import numpy as np
 
 import tifffile
 from magicgui.widgets import FileEdit
+from napari import Viewer
+from napari.experimental import link_layers, unlink_layers
+from napari.qt.threading import thread_worker
 from napari.settings import SETTINGS
 from napari_plugin_engine import napari_hook_implementation
+from qtpy.QtCore import QObject, QSize, Qt, QTimer, Signal
+from qtpy.QtGui import QIcon, QImage, QPixmap
 from qtpy.QtWidgets import (
+    QAbstractItemView,
+    QCheckBox,
+    QComboBox,
     QFileDialog,
     QLabel,
     QLineEdit,
     QListWidget,
     QListWidgetItem,
+    QProgressBar,
+    QSpinBox,
     QVBoxLayout,
     QWidget,
 )
 
-from hsafm_base.hsafm_base import HSAFM
+from hsafm_base.cache import HeightCache
+from hsafm_base.drift import corrected, load_drift
+from hsafm_base.edits import FrameEdits
+from hsafm_base.export import export_tiff
+from hsafm_base.hsafm_base import HSAFM, STORAGE
+from hsafm_base.index import MetadataIndex, list_asd
+from hsafm_base.kymograph import hsafm_kymograph, kymograph
+from hsafm_base.level import header_tilt, leveled
+from hsafm_base.pyramid import pyramid
+from hsafm_base.stats import contrast_limits, header_limits, stack_stats
+from hsafm_base.temporal import TemporalFilter
+from hsafm_base.thumbnails import SIZE, Thumbnails
+from hsafm_base.lut import AFM_LUT
+
+from ._playback import PlaybackCache
+from ._prefetch import HSAFMCache, Prefetcher, ram_bytes
+
+
+@lru_cache(maxsize=None)
+def afm_colormap():
+    """vispy colormap of AFM_LUT, built once on first use"""
+    from vispy.color import Colormap
+
+    return Colormap(AFM_LUT)
+
+
+@thread_worker
+def load_file(fname, prefetcher):
+    """open fname off the GUI thread
+
+    yields the lazily mapped HSAFM first so it can be shown right away, then
+    the number of frames decoded, and returns the decoded HSAFM. Nothing
+    blocks before the first yield, so quit() always stops it
+    """
+    hsafm = prefetcher.get(fname)
+    if hsafm is not None:
+        return hsafm
+
+    height_cache = prefetcher.height_cache
+    hsafm = HSAFM(fname, mmap=True, cache=height_cache, storage=prefetcher.storage)
+    if not hsafm.lazy:  # converted before, mapped from the height cache
+        prefetcher.cache.put(fname, hsafm)
+        return hsafm
+
+    yield hsafm
+    # a prefetch already decoding fname is waited on in short steps
+    future = prefetcher.decoding(fname)
+    while future is not None and not future.done():
+        yield prefetcher.progress(fname)
+        wait([future], timeout=0.1)
+    decoded = prefetcher.cache.get(fname)
+    if decoded is not None:
+        return decoded
+
+    nbytes = ram_bytes(
+        hsafm.height.shape, hsafm.numberChannels, height_cache, hsafm.storage
+    )
+    if nbytes <= prefetcher.cache.max_bytes:
+        yield from hsafm.load(cache=height_cache)
+        prefetcher.cache.put(fname, hsafm)
+    return hsafm
+
+
+@thread_worker
+def build_index(index):
+    """index the headers of new or modified files, then save the sidecar"""
+    yield from index.build()
+    index.save()
+
+
+@thread_worker
+def build_thumbnails(thumbnails, names):
+    """keyframe strips of names, cached ones first, then from a process pool"""
+    yield from thumbnails.build(names)
+
+
+def thumbnail_icon(strip):
+    """QIcon of a uint8 keyframe strip in the AFM colormap"""
+    rgb = np.ascontiguousarray((AFM_LUT * 255).astype("uint8")[strip])
+    height, width = strip.shape
+    image = QImage(rgb.data, width, height, 3 * width, QImage.Format_RGB888)
+    return QIcon(QPixmap.fromImage(image.copy()))
+
+
+@thread_worker
+def export_file(hsafm, fname, stack, asd_dir, progress):
+    """copy the asd file to asd_dir and stream stack into the tiff fname"""
+    shutil.copy(hsafm.fullName, asd_dir)
+    export_tiff(hsafm, fname, stack, progress=progress)
+
+
+@thread_worker
+def drift_file(hsafm, reference):
+    """drift of every frame, estimated once per file and kept in .hsafm/"""
+    return load_drift(hsafm, reference)
+
+
+@thread_worker
+def movie_stats(hsafm, stack, edits):
+    """per-frame stats of the frames of stack kept by edits
+
+    those of the plain height stack are kept by hsafm
+    """
+    if stack is hsafm.height:
+        return {key: value[edits.frames] for key, value in hsafm.stats.items()}
+    return stack_stats(edits.view(stack))
+
+
+def stats_plot(hsafm, stats):
+    """matplotlib canvas of the per-frame min, mean and max over time"""
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(4, 2.5), tight_layout=True)
+    axes = figure.add_subplot()
+    time = np.arange(len(stats["mean"])) * hsafm.frameAcqTime / 1000
+    for key in ("min", "mean", "max"):
+        axes.plot(time, stats[key], label=key)
+    axes.set_xlabel("time (s)")
+    axes.set_ylabel("height (nm)")
+    axes.legend()
+    return FigureCanvasQTAgg(figure)
+
+
+# layer attributes shared by the channels of a movie
+LINKED = ("scale", "translate", "visible")
+
+
+class ExportProgress(QObject):
+    changed = Signal(int)  # frames written, emitted from the export thread
+
+
+SORT_KEYS = {
+    "sort by name": lambda name, entry: name,
+    "sort by date": lambda name, entry: entry.get("date", ""),
+    "sort by frames": lambda name, entry: entry.get("frames", 0),
+    "sort by scan size": lambda name, entry: (
+        entry.get("xScanRange", 0) * entry.get("yScanRange", 0)
+    ),
+}
 
 
 class hsAFMBrowser(QWidget):
@@ -42,42 +193,380 @@ class hsAFMBrowser(QWidget):
         self.setLayout(QVBoxLayout())
         dir_edit = FileEdit(value=file, mode="d")  # return one existing directory
         self.layout().addWidget(dir_edit.native)
+        filter_edit = QLineEdit()
+        filter_edit.setPlaceholderText("filter by name or comment")
+        self.layout().addWidget(filter_edit)
+        sort_by = QComboBox()
+        sort_by.addItems(list(SORT_KEYS))
+        self.layout().addWidget(sort_by)
         self.layout().addWidget(file_list)
+        show_thumbnails = QCheckBox("thumbnails (first, middle, last frame)")
+        self.layout().addWidget(show_thumbnails)
+        compare = QCheckBox("compare selected files")
+        self.layout().addWidget(compare)
+        sync_by = QComboBox()
+        sync_by.addItems(["sync by frame", "sync by acquisition time"])
+        self.layout().addWidget(sync_by)
+        # 2x reduced levels of large scans, read when zoomed out
+        multiscale = QCheckBox("multiscale")
+        self.layout().addWidget(multiscale)
+        leveling = QComboBox()
+        leveling.addItems(["no leveling", "plane", "line", "median", "tilt"])
+        self.layout().addWidget(leveling)
+        # running mean / median or gaussian over time, as an extra layer
+        temporal = QComboBox()
+        temporal.addItems(["no temporal filter", "mean", "median", "gaussian"])
+        self.layout().addWidget(temporal)
+        temporal_window = QSpinBox()
+        temporal_window.setRange(1, 99)
+        temporal_window.setValue(5)
+        temporal_window.setPrefix("window (frames, 2 sigma for gaussian): ")
+        self.layout().addWidget(temporal_window)
+        self.layout().addWidget(QLabel("drift reference (Shift-d)"))
+        drift_reference = QComboBox()
+        drift_reference.addItems(["first", "running"])
+        self.layout().addWidget(drift_reference)
         for key, value in meta_list.items():
             self.layout().addWidget(value)
         self.layout().addWidget(QLabel("save to"))
         save_to = QLineEdit()
         self.layout().addWidget(save_to)
+        progress = QProgressBar()
+        progress.setFormat("decoding frame %v / %m")
+        progress.hide()
+        self.layout().addWidget(progress)
+        self.hsafm = None
+        self.stats_dock = None
+        self.kymograph_viewer = None
+        self.loader = None
+        self.indexer = None
+        self.thumbnailer = None
+        self.icons = {}
+        export_progress = QProgressBar()
+        export_progress.setFormat("exporting frame %v / %m")
+        export_progress.hide()
+        self.layout().addWidget(export_progress)
+        exported = ExportProgress()
+        exported.changed.connect(export_progress.setValue)
+        self.exporters = []
+        self.layout().addWidget(QLabel("prefetch cache (MB)"))
+        cache_size = QSpinBox()
+        cache_size.setRange(0, 2 ** 20)
+        cache_size.setValue(2048)
+        self.layout().addWidget(cache_size)
+
+        # deleted and trimmed frames are kept in .hsafm/ and reapplied
+        save_edits = QCheckBox("save frame edits")
+        self.layout().addWidget(save_edits)
+        self.edits = FrameEdits(0)
+
+        # play a uint8 copy of the movie for the current contrast limits
+        playback_cache = QCheckBox("uint8 playback cache")
+        self.layout().addWidget(playback_cache)
+        self.playback = None
+        self.playback_builder = None
+        self.unlinked = []  # layers whose visible link playback removed
+
+        self.prefetch_files = 2  # files decoded ahead on each side
+        self.prefetcher = Prefetcher(HSAFMCache(cache_size.value() * 2 ** 20))
+        cache_size.valueChanged.connect(
+            lambda value: self.prefetcher.cache.resize(value * 2 ** 20)
+        )
+        # float16 or raw uint16 hold twice as many movies in the same memory
+        self.layout().addWidget(QLabel("decoded storage"))
+        storage = QComboBox()
+        storage.addItems(list(STORAGE))
+        self.layout().addWidget(storage)
+        storage.currentTextChanged.connect(
+            lambda text: setattr(self.prefetcher, "storage", text)
+        )
+
+        # decoded height stacks kept on disk, empty directory disables it
+        self.layout().addWidget(QLabel("height cache directory, size (GB)"))
+        height_cache_dir = QLineEdit()
+        self.layout().addWidget(height_cache_dir)
+        height_cache_size = QSpinBox()
+        height_cache_size.setRange(1, 2 ** 16)
+        height_cache_size.setValue(20)
+        self.layout().addWidget(height_cache_size)
+
+        def height_cache_changed():
+            directory = height_cache_dir.text().strip()
+            self.prefetcher.height_cache = (
+                HeightCache(directory, height_cache_size.value() * 2 ** 30)
+                if directory
+                else None
+            )
+
+        height_cache_dir.editingFinished.connect(height_cache_changed)
+        height_cache_size.valueChanged.connect(lambda value: height_cache_changed())
+
+        def prefetch_neighbours():
+            row = file_list.currentRow()
+            rows = []
+            for step in range(1, self.prefetch_files + 1):
+                rows.extend([row + step, row - step])
+            self.prefetcher.prefetch(
+                path.join(self.current_dir, file_list.item(r).file_name)
+                for r in rows
+                if 0 <= r < file_list.count()
+            )
+
+        def describe(entry):
+            if "error" in entry:
+                return entry["error"]
+            return (
+                f"{entry['date']}\n"
+                f"{entry['frames']} frames, {entry['frameAcqTime']:g} ms/frame\n"
+                f"{entry['xScanRange']} x {entry['yScanRange']} nm, "
+                f"{entry['xPixel']} x {entry['yPixel']} pixels\n"
+                f"{entry['comment']}"
+            )
+
+        def populate():
+            current = file_list.currentItem()
+            current = current.file_name if current else None
+            text = filter_edit.text().lower()
+            names = []
+            for name in list_asd(self.current_dir):
+                entry = self.index.entries.get(name, {})
+                if text in name.lower() or text in entry.get("comment", "").lower():
+                    names.append(name)
+            sort_key = SORT_KEYS[sort_by.currentText()]
+            entries = self.index.entries
+            names.sort(key=lambda name: sort_key(name, entries.get(name, {})))
+
+            file_list.blockSignals(True)
+            file_list.clear()
+            for name in names:
+                item = QListWidgetItem(name)
+                item.file_name = name
+                if name in self.index.entries:
+                    item.setToolTip(describe(self.index.entries[name]))
+                if show_thumbnails.isChecked() and name in self.icons:
+                    item.setIcon(self.icons[name])
+                file_list.addItem(item)
+            file_list.blockSignals(False)
+
+            if current in names:
+                # keep the open file selected without reopening it
+                file_list.blockSignals(True)
+                file_list.setCurrentRow(names.index(current))
+                file_list.blockSignals(False)
+            else:
+                file_list.setCurrentRow(0)
+
+        def on_indexed(result):
+            name, entry = result
+            for item in file_list.findItems(name, Qt.MatchExactly):
+                item.setToolTip(describe(entry))
+
+        def on_thumbnail(result):
+            name, strip = result
+            self.icons[name] = thumbnail_icon(strip)
+            for item in file_list.findItems(name, Qt.MatchExactly):
+                item.setIcon(self.icons[name])
+
+        def thumbnails_toggled(checked):
+            if self.thumbnailer is not None:
+                self.thumbnailer.quit()
+                self.thumbnailer = None
+            if not checked:
+                file_list.setIconSize(QSize())
+                populate()
+                return
+            file_list.setIconSize(QSize(3 * SIZE + 2, SIZE))
+            populate()
+            names = [
+                name for name in list_asd(self.current_dir) if name not in self.icons
+            ]
+            self.thumbnailer = build_thumbnails(Thumbnails(self.current_dir), names)
+            self.thumbnailer.yielded.connect(on_thumbnail)
+            self.thumbnailer.start()
 
         def dir_changed():
             self.current_dir = (
                 str(dir_edit.value.absolute()).replace("\\", "/").replace("//", "/")
             )
+            if self.indexer is not None:
+                self.indexer.quit()
+            self.index = MetadataIndex(self.current_dir)
+            self.icons = {}
             file_list.clear()
-            for f in listdir(self.current_dir):
-                if f.endswith(".asd") and not f.startswith("._"):
-                    item = QListWidgetItem(f)
-                    item.file_name = f
-                    file_list.addItem(item)
-            file_list.sortItems()
-            file_list.setCurrentRow(0)
+            populate()
+
+            # header fields of new or modified files, in the background
+            self.indexer = build_index(self.index)
+            self.indexer.yielded.connect(on_indexed)
+            self.indexer.returned.connect(lambda result: populate())
+            self.indexer.start()
+            if show_thumbnails.isChecked():
+                thumbnails_toggled(True)
 
         def file_open():
+            follow_timer.stop()
+            # a newer selection cancels the load in flight
+            if self.loader is not None:
+                self.loader.quit()
+                self.loader = None
+            if compare.isChecked():
+                return
+
             file = file_list.currentItem()
-            if file:
-                self.hsafm = HSAFM(path.join(self.current_dir, file.file_name))
+            if not file:
+                return
+            fname = path.join(self.current_dir, file.file_name)
+            worker = load_file(fname, self.prefetcher)
 
-            if self.viewer.window.qt_viewer.dims.is_playing:
-                self.viewer.window.qt_viewer.dims.stop()
+            def on_yielded(value):
+                if worker is not self.loader:
+                    return
+                if isinstance(value, HSAFM):
+                    show(value)
+                    progress.setRange(0, len(value.height) * value.numberChannels)
+                    progress.setValue(0)
+                    progress.show()
+                else:
+                    progress.setValue(value)
+
+            def on_returned(hsafm):
+                if worker is not self.loader:
+                    return
+                progress.hide()
+                self.loader = None
+                if hsafm is self.hsafm:
+                    update_layers()  # swap the lazy stacks for the decoded ones
+                elif self.hsafm is not None and hsafm.fullName == self.hsafm.fullName:
+                    # decoded by a prefetch while the lazy one was shown
+                    self.hsafm = hsafm
+                    update_layers()
+                else:
+                    show(hsafm)
+
+            worker.yielded.connect(on_yielded)
+            worker.returned.connect(on_returned)
+            self.loader = worker
+            worker.start()
 
-            if len(self.viewer.layers):
-                for i in range(0, len(self.viewer.layers)):
-                    self.viewer.layers.pop(i)
+        def height(hsafm):
+            """the height stack of hsafm, leveled lazily as selected"""
+            method = leveling.currentText()
+            if method == "no leveling":
+                return hsafm.height
+            return leveled(hsafm.height, method, tilt=header_tilt(hsafm))
+
+        def update_layers():
+            """layer data of the open file, leveled and with its frame edits"""
+            if self.hsafm is None or "height (nm)" not in self.viewer.layers:
+                return
+            for channel, stack in enumerate(self.hsafm.channels):
+                if channel == 0:
+                    stack = height(self.hsafm)
+                layer = self.viewer.layers[self.hsafm.channel_name(channel)]
+                stack = self.edits.view(stack)
+                layer.data = pyramid(stack) if layer.multiscale else stack
+            update_filtered()
+            if self.playback is not None:
+                stop_playback()
+                start_playback()
+
+        def update_filtered():
+            """the temporally filtered height layer, computed per shown frame"""
+            name = "filtered (nm)"
+            method = temporal.currentText()
+            if self.hsafm is None or "height (nm)" not in self.viewer.layers:
+                return
+            if method == "no temporal filter":
+                if name in self.viewer.layers:
+                    self.viewer.layers.remove(name)
+                return
+            window = temporal_window.value()
+            data = TemporalFilter(
+                full_resolution(self.viewer.layers["height (nm)"]),
+                method,
+                window=window,
+                sigma=window / 2,
+            )
+            if name in self.viewer.layers:
+                self.viewer.layers[name].data = data
+                return
+            layer = self.viewer.layers["height (nm)"]
             self.viewer.add_image(
-                self.hsafm.height,
+                data,
+                name=name,
+                colormap=layer.colormap,
+                contrast_limits=layer.contrast_limits,
+            )
+
+        def layer_data(stack):
+            """stack, or its pyramid when multiscale is checked and it helps"""
+            if multiscale.isChecked():
+                levels = pyramid(stack)
+                if len(levels) > 1:
+                    return levels
+            return stack
+
+        def full_resolution(layer):
+            return layer.data[0] if layer.multiscale else layer.data
+
+        def add_height(stack, contrast_limits):
+            data = layer_data(stack)
+            layer = self.viewer.add_image(
+                data,
+                multiscale=isinstance(data, list),
                 name="height (nm)",
-                colormap=("afm-lut", self.hsafm.afm_lut),
+                colormap=("afm-lut", afm_colormap()),
+                contrast_limits=contrast_limits,
             )
+            layer.events.contrast_limits.connect(lambda event: rebuild_playback())
+            return layer
+
+        def multiscale_toggled():
+            """rebuild the height layer only, edits and view are kept"""
+            if self.hsafm is None or "height (nm)" not in self.viewer.layers:
+                return
+            dims = self.viewer.window.qt_viewer.dims.slider_widgets[0].dims
+            step = dims.current_step[0]
+            playing = self.playback is not None
+            stop_playback()
+            layers = self.viewer.layers
+            old = layers["height (nm)"]
+            index = layers.index(old)
+            channels = [
+                layers[self.hsafm.channel_name(channel)]
+                for channel in range(1, self.hsafm.numberChannels)
+            ]
+            if channels:
+                unlink_layers([old])
+            layers.remove(old)
+            layer = add_height(self.edits.view(height(self.hsafm)), old.contrast_limits)
+            layers.move(layers.index(layer), index)
+            if channels:
+                link_layers([layer] + channels, LINKED)
+            dims.set_current_step(0, step)
+            if playing:
+                start_playback()
+
+        def edits_changed():
+            update_layers()
+            if save_edits.isChecked():
+                self.edits.save(self.hsafm.fullName)
+
+        def show(hsafm):
+            self.hsafm = hsafm
+
+            if self.viewer.window.qt_viewer.dims.is_playing:
+                self.viewer.window.qt_viewer.dims.stop()
+            stop_playback()
+
+            self.viewer.layers.clear()
+            if save_edits.isChecked():
+                self.edits = FrameEdits.load(hsafm.fullName, len(hsafm.height))
+            else:
+                self.edits = FrameEdits(len(hsafm.height))
+            stack = self.edits.view(height(hsafm))
+            # avoid napari scanning the whole lazy stack for a data range
+            add_height(stack, [0, float(stack[0].max()) or 1])
 
             self.viewer.window.qt_viewer.dims.slider_widgets[0].dims.set_current_step(
                 0, 0
@@ -88,6 +577,22 @@ class hsAFMBrowser(QWidget):
             self.viewer.window.qt_viewer.controls.children()[-1].autoScaleBar.children()[2].setChecked(1)
             SETTINGS.application.playback_fps = 10
 
+            # other channels (phase, error, ...) side by side, linked to height
+            if hsafm.numberChannels > 1:
+                for channel in range(1, hsafm.numberChannels):
+                    stack = self.edits.view(hsafm.channels[channel])
+                    self.viewer.add_image(
+                        stack,
+                        name=hsafm.channel_name(channel),
+                        colormap="gray",
+                        contrast_limits=[
+                            float(stack[0].min()),
+                            float(stack[0].max()) + 1e-6,
+                        ],
+                    )
+                link_layers(list(self.viewer.layers), LINKED)
+            self.viewer.grid.enabled = hsafm.numberChannels > 1
+
             meta_list["scan_range"].setText(
                 f"scan range (nm): \t {self.hsafm.xScanRange} x {self.hsafm.yScanRange}"
             )
@@ -108,12 +613,74 @@ class hsAFMBrowser(QWidget):
             )
             meta_list["comment"].setText(f"comment: \t\t {self.hsafm.comment}")
 
+            update_filtered()
+            prefetch_neighbours()
+
+        def single_file():
+            """True while one file is shown, not the compared files"""
+            return self.hsafm is not None and "height (nm)" in self.viewer.layers
+
         @self.viewer.bind_key("Space")
         def toggle_play(viewer):
             if not viewer.window.qt_viewer.dims.is_playing:
+                if playback_cache.isChecked() and single_file():
+                    start_playback()
                 viewer.window.qt_viewer.dims.play()
             else:
                 viewer.window.qt_viewer.dims.stop()
+                stop_playback()
+
+        def rebuild_playback():
+            if self.playback is None:
+                return
+            limits = tuple(self.viewer.layers["height (nm)"].contrast_limits)
+            if limits == self.playback.limits and self.playback_builder is not None:
+                return
+            if self.playback_builder is not None:
+                self.playback_builder.quit()
+            self.playback.set_limits(limits)
+            dims = self.viewer.window.qt_viewer.dims.slider_widgets[0].dims
+            self.playback_builder = thread_worker(self.playback.build)(
+                start=dims.current_step[0]
+            )
+            self.playback_builder.start()
+
+        def start_playback():
+            """show the uint8 copy instead of the height layer while playing"""
+            layer = self.viewer.layers["height (nm)"]
+            self.playback = PlaybackCache(full_resolution(layer))
+            rebuild_playback()
+            self.viewer.add_image(
+                self.playback.data,
+                name="playback",
+                colormap=layer.colormap,
+                contrast_limits=[0, 255],
+            )
+            # the other channels stay visible, their link is restored on stop
+            self.unlinked = [layer] + [
+                self.viewer.layers[self.hsafm.channel_name(channel)]
+                for channel in range(1, self.hsafm.numberChannels)
+            ]
+            if len(self.unlinked) > 1:
+                unlink_layers([layer], ("visible",))
+            layer.visible = False
+
+        def stop_playback():
+            if self.playback is None:
+                return
+            if self.playback_builder is not None:
+                self.playback_builder.quit()
+                self.playback_builder = None
+            self.playback = None
+            if "playback" in self.viewer.layers:
+                self.viewer.layers.remove("playback")
+            if "height (nm)" in self.viewer.layers:
+                self.viewer.layers["height (nm)"].visible = True
+            unlinked, self.unlinked = self.unlinked, []
+            if len(unlinked) > 1 and all(
+                layer in self.viewer.layers for layer in unlinked
+            ):
+                link_layers(unlinked, ("visible",))
 
         @self.viewer.bind_key("j")
         def next_file(viewer):
@@ -221,12 +788,217 @@ class hsAFMBrowser(QWidget):
                 0, _max
             )
 
+        def compare_open():
+            """every selected file as a lazy layer, in a grid"""
+            if not compare.isChecked():
+                return
+            if self.viewer.window.qt_viewer.dims.is_playing:
+                self.viewer.window.qt_viewer.dims.stop()
+            stop_playback()
+            self.viewer.layers.clear()
+            # no single file is open, its edits must not be changed or saved
+            self.hsafm = None
+            self.edits = FrameEdits(0)
+            for item in file_list.selectedItems():
+                fname = path.join(self.current_dir, item.file_name)
+                hsafm = self.prefetcher.cache.get(fname) or HSAFM(
+                    fname, mmap=True, cache=self.prefetcher.height_cache
+                )
+                # frames line up by index, or by time (ms) on the first axis
+                if sync_by.currentText() == "sync by acquisition time":
+                    scale = (hsafm.frameAcqTime, 1, 1)
+                else:
+                    scale = (1, 1, 1)
+                self.viewer.add_image(
+                    hsafm.height,
+                    name=item.file_name,
+                    colormap=("afm-lut", afm_colormap()),
+                    contrast_limits=[0, float(hsafm.height[0].max()) or 1],
+                    scale=scale,
+                )
+            self.viewer.grid.enabled = True
+
+        def compare_toggled(checked):
+            file_list.setSelectionMode(
+                QAbstractItemView.ExtendedSelection
+                if checked
+                else QAbstractItemView.SingleSelection
+            )
+            if checked:
+                follow_timer.stop()
+                compare_open()
+            else:
+                self.viewer.grid.enabled = False
+                file_open()
+
+        def follow():
+            if not self.hsafm.refresh():
+                return
+            dims = self.viewer.window.qt_viewer.dims.slider_widgets[0].dims
+            at_end = dims.current_step[0] >= dims.nsteps[0] - 1
+            self.edits.extend(len(self.hsafm.height))
+            update_layers()
+            if at_end:
+                dims.set_current_step(0, len(self.edits) - 1)
+            meta_list["record_duration"].setText(
+                f"record duration: \t {datetime.timedelta(milliseconds=self.hsafm.frameAcqTime*self.hsafm.frameNumber[-1])}"
+            )
+
+        follow_timer = QTimer(self)
+        follow_timer.timeout.connect(follow)
+
+        @self.viewer.bind_key("f")
+        def toggle_follow(viewer):
+            if not single_file():
+                return
+            if follow_timer.isActive():
+                follow_timer.stop()
+                return
+            # new frames are mapped by HSAFM.refresh, a full decode would
+            # only be out of date when it returns
+            if self.loader is not None:
+                self.loader.quit()
+                self.loader = None
+            follow_timer.start(max(50, int(self.hsafm.frameAcqTime)))
+
         @self.viewer.bind_key("Alt-c")
         def reset_contrast(viewer):
             viewer.layers[0].reset_contrast_limits()
 
+        def with_stats(callback):
+            """call callback(stats) of the displayed height once available"""
+            hsafm = self.hsafm
+            worker = movie_stats(hsafm, height(hsafm), self.edits)
+            worker.returned.connect(
+                lambda stats: callback(stats) if hsafm is self.hsafm else None
+            )
+            worker.start()
+
+        def fixed_contrast(layer, limits):
+            """set limits and switch off the continuous autoscale of show()
+
+            which would reset them from every newly displayed frame
+            """
+            controls = self.viewer.window.qt_viewer.controls.widgets.get(layer)
+            if controls is not None:
+                controls.autoScaleBar.children()[2].setChecked(0)
+            layer._keep_auto_contrast = False
+            layer.contrast_limits = limits
+
+        @self.viewer.bind_key("Shift-c")
+        def global_contrast(viewer):
+            if not single_file():
+                return
+            def apply(stats):
+                if "height (nm)" in viewer.layers:
+                    limits = contrast_limits(stats)
+                    fixed_contrast(viewer.layers["height (nm)"], limits)
+
+            # a lazy movie gets the header ranges at once, refined once the
+            # frames are scanned
+            if self.hsafm.lazy and leveling.currentText() == "no leveling":
+                limits = header_limits(self.hsafm, self.edits.frames)
+                if limits is not None:
+                    fixed_contrast(viewer.layers["height (nm)"], limits)
+            with_stats(apply)
+
+        @self.viewer.bind_key("Shift-s")
+        def plot_stats(viewer):
+            if not single_file():
+                return
+            def plot(stats):
+                try:
+                    canvas = stats_plot(self.hsafm, stats)
+                except ImportError:
+                    viewer.status = "plotting frame statistics needs matplotlib"
+                    return
+                if self.stats_dock is not None:
+                    viewer.window.remove_dock_widget(self.stats_dock)
+                self.stats_dock = viewer.window.add_dock_widget(
+                    canvas, name="frame statistics", area="bottom"
+                )
+
+            with_stats(plot)
+
+        def update_kymograph():
+            """kymograph along the last line of the kymograph layer"""
+            if "kymograph line" not in self.viewer.layers:
+                return
+            lines = self.viewer.layers["kymograph line"].data
+            if not lines or "height (nm)" not in self.viewer.layers:
+                return
+            start, end = lines[-1][0, -2:], lines[-1][-1, -2:]
+            if leveling.currentText() == "no leveling":
+                # only the pixels along the line are read from the file
+                data = hsafm_kymograph(self.hsafm, start, end)[self.edits.frames]
+            else:
+                stack = full_resolution(self.viewer.layers["height (nm)"])
+                data = kymograph(stack, start, end)
+
+            if self.kymograph_viewer is None:
+                self.kymograph_viewer = Viewer(title="kymograph")
+                self.kymograph_viewer.window._qt_window.destroyed.connect(
+                    lambda: setattr(self, "kymograph_viewer", None)
+                )
+            layers = self.kymograph_viewer.layers
+            if "kymograph (nm)" in layers:
+                layers["kymograph (nm)"].data = data
+            else:
+                self.kymograph_viewer.add_image(
+                    data,
+                    name="kymograph (nm)",
+                    colormap=("afm-lut", afm_colormap()),
+                    # time (s) down, distance along the line (pixels) across
+                    scale=(self.hsafm.frameAcqTime / 1000, 1),
+                )
+
+        # coalesce the events of a dragged line into one update per tick
+        kymograph_timer = QTimer(self)
+        kymograph_timer.setSingleShot(True)
+        kymograph_timer.timeout.connect(update_kymograph)
+
+        @self.viewer.bind_key("Shift-k")
+        def draw_kymograph_line(viewer):
+            if not single_file():
+                return
+            if "kymograph line" not in viewer.layers:
+                layer = viewer.add_shapes(
+                    name="kymograph line", edge_color="white", edge_width=1
+                )
+                layer.events.data.connect(lambda event: kymograph_timer.start(30))
+                layer.events.set_data.connect(lambda event: kymograph_timer.start(30))
+            layer = viewer.layers["kymograph line"]
+            viewer.layers.selection.active = layer
+            layer.mode = "add_line"
+
+        @self.viewer.bind_key("Shift-d")
+        def correct_drift(viewer):
+            if not single_file():
+                return
+            hsafm = self.hsafm
+            worker = drift_file(hsafm, drift_reference.currentText())
+
+            def on_returned(shifts):
+                if hsafm is not self.hsafm:
+                    return
+                name = "drift corrected (nm)"
+                if name in viewer.layers:
+                    viewer.layers.remove(name)
+                layer = viewer.layers["height (nm)"]
+                viewer.add_image(
+                    self.edits.view(corrected(height(hsafm), shifts)),
+                    name=name,
+                    colormap=layer.colormap,
+                    contrast_limits=layer.contrast_limits,
+                )
+
+            worker.returned.connect(on_returned)
+            worker.start()
+
         @self.viewer.bind_key("Shift-z")
         def save_as_tiff(viewer):
+            if not single_file():
+                return
             if save_to.text():
                 save_dir = path.join(self.current_dir, save_to.text())
             else:
@@ -239,17 +1011,27 @@ class hsAFMBrowser(QWidget):
             if not path.exists(path.join(save_dir, save_name)):
                 makedirs(path.join(save_dir, save_name))
 
-            shutil.copy(path.join(self.current_dir, file_list.currentItem().file_name), save_dir)
-            tifffile.imwrite(
+            # copy and convert off the GUI thread, streaming frame by frame
+            stack = full_resolution(viewer.layers["height (nm)"])
+            worker = export_file(
+                self.hsafm,
                 f"{save_dir}/{save_name}/{save_name}.tiff",
-                viewer.layers["height (nm)"].data,
-                imagej=True,
-                resolution=(self.hsafm.xPixel/self.hsafm.xScanRange, self.hsafm.yPixel/self.hsafm.yScanRange),
-                metadata={'axes':'ZYX', 'unit':'nm', 'finterval':self.hsafm.frameAcqTime/1000},
+                stack,
+                save_dir,
+                exported.changed.emit,
             )
+            export_progress.setRange(0, len(stack))
+            export_progress.setValue(0)
+            export_progress.show()
+            worker.finished.connect(export_progress.hide)
+            self.exporters.append(worker)
+            worker.finished.connect(lambda: self.exporters.remove(worker))
+            worker.start()
 
         @self.viewer.bind_key("y")
         def save_slice_as_tiff(viewer):
+            if not single_file():
+                return
             if save_to.text():
                 save_dir = path.join(self.current_dir, save_to.text())
             else:
@@ -267,17 +1049,55 @@ class hsAFMBrowser(QWidget):
 
             tifffile.imwrite(
                 f"{save_dir}/{save_name}-{current_slice}.tiff",
-                viewer.layers["height (nm)"].data[current_slice],
+                full_resolution(viewer.layers["height (nm)"])[current_slice],
                 imagej=True,
             )
 
         @self.viewer.bind_key("x")
         def del_slice(viewer):
+            if not single_file():
+                return
+            current_slice = viewer.window.qt_viewer.dims.slider_widgets[0].dims.current_step[0]
+            if len(self.edits) > 1:
+                self.edits.delete(current_slice)
+                edits_changed()
+
+        @self.viewer.bind_key("Shift-h")
+        def trim_before(viewer):
+            if not single_file():
+                return
             current_slice = viewer.window.qt_viewer.dims.slider_widgets[0].dims.current_step[0]
-            viewer.layers["height (nm)"].data = np.delete(viewer.layers["height (nm)"].data, current_slice, 0)
+            self.edits.trim(start=current_slice)
+            edits_changed()
+            viewer.window.qt_viewer.dims.slider_widgets[0].dims.set_current_step(0, 0)
+
+        @self.viewer.bind_key("Shift-l")
+        def trim_after(viewer):
+            if not single_file():
+                return
+            current_slice = viewer.window.qt_viewer.dims.slider_widgets[0].dims.current_step[0]
+            self.edits.trim(stop=current_slice + 1)
+            edits_changed()
+
+        @self.viewer.bind_key("Shift-x")
+        def restore_slices(viewer):
+            if not single_file():
+                return
+            self.edits.restore()
+            edits_changed()
 
         dir_edit.line_edit.changed.connect(dir_changed)
+        filter_edit.textChanged.connect(lambda text: populate())
+        sort_by.currentTextChanged.connect(lambda text: populate())
         file_list.currentItemChanged.connect(file_open)
+        file_list.itemSelectionChanged.connect(compare_open)
+        compare.toggled.connect(compare_toggled)
+        show_thumbnails.toggled.connect(thumbnails_toggled)
+        multiscale.toggled.connect(lambda checked: multiscale_toggled())
+        sync_by.currentTextChanged.connect(lambda text: compare_open())
+        leveling.currentTextChanged.connect(lambda text: update_layers())
+        temporal.currentTextChanged.connect(lambda text: update_filtered())
+        temporal_window.valueChanged.connect(lambda value: update_filtered())
         dir_changed()  # run once to initialize
 
 
@@ -0,0 +1,73 @@
+import threading
+
+import numpy as np
+
+from hsafm_base.stack import LazyStack
+
+
+def to_uint8(frames, limits, out=None):
+    """map frames within the contrast limits (low, high) onto 0 - 255"""
+    low, high = limits
+    scale = np.float32(255 / (high - low) if high > low else 0)
+    frames = np.subtract(frames, np.float32(low), dtype="float32")
+    frames *= scale
+    np.clip(frames, 0, 255, out=frames)
+    np.rint(frames, out=frames)
+    if out is None:
+        return frames.astype("uint8")
+    out[...] = frames
+    return out
+
+
+class PlaybackCache:
+    """display-ready uint8 copy of a stack for the current contrast limits
+
+    data is a LazyStack handed to napari with contrast limits (0, 255), so
+    playback only moves bytes to the GPU. build() fills the copy chunk by
+    chunk from a background thread, starting at the displayed frame; frames
+    not built yet are converted on demand. New limits invalidate the copy
+    and a running build stops at its next chunk
+    """
+
+    def __init__(self, stack):
+        self.stack = stack
+        self.frames = np.zeros(stack.shape, dtype="uint8")
+        self.ready = np.zeros(len(stack), dtype=bool)
+        self.limits = (0.0, 1.0)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.data = LazyStack(self.frame, len(stack), stack.shape[1:], dtype="uint8")
+
+    def set_limits(self, limits):
+        with self._lock:
+            self.limits = tuple(float(limit) for limit in limits)
+            self._generation += 1
+            self.ready[:] = False
+
+    def frame(self, index):
+        with self._lock:
+            if self.ready[index]:
+                return self.frames[index]
+            limits = self.limits
+        return to_uint8(np.asarray(self.stack[index]), limits)
+
+    def build(self, start=0, chunk=64):
+        """convert the stack from frame start on, wrapping around
+
+        a generator yielding the number of frames converted
+        """
+        with self._lock:
+            generation, limits = self._generation, self.limits
+        n = len(self.stack)
+        first = start - start % chunk
+        done = 0
+        for begin in list(range(first, n, chunk)) + list(range(0, first, chunk)):
+            end = min(begin + chunk, n)
+            converted = to_uint8(np.asarray(self.stack[begin:end]), limits)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self.frames[begin:end] = converted
+                self.ready[begin:end] = True
+            done += end - begin
+            yield done
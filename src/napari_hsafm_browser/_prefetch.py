@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from hsafm_base.hsafm_base import HSAFM, STORAGE, count_frames, read_header
+
+
+class HSAFMCache:
+    """LRU cache of decoded HSAFM objects, bounded by bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(hsafm.nbytes for hsafm in self._items.values())
+
+    def __contains__(self, fname):
+        with self._lock:
+            return fname in self._items
+
+    def get(self, fname):
+        with self._lock:
+            hsafm = self._items.get(fname)
+            if hsafm is not None:
+                self._items.move_to_end(fname)
+            return hsafm
+
+    def put(self, fname, hsafm):
+        with self._lock:
+            self._items.pop(fname, None)
+            if hsafm.nbytes > self.max_bytes:
+                return
+            self._items[fname] = hsafm
+            total = sum(item.nbytes for item in self._items.values())
+            while total > self.max_bytes:
+                _, oldest = self._items.popitem(last=False)
+                total -= oldest.nbytes
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        with self._lock:
+            total = sum(item.nbytes for item in self._items.values())
+            while total > self.max_bytes and self._items:
+                _, oldest = self._items.popitem(last=False)
+                total -= oldest.nbytes
+
+
+def ram_bytes(shape, channels, height_cache=None, storage="float32"):
+    """bytes a load of channels stacks of shape leaves in RAM
+
+    every channel is decoded into RAM, but the height goes to the height
+    cache when it takes stacks of that shape
+    """
+    to_disk = height_cache is not None and height_cache.accepts(shape)
+    return int(np.prod(shape)) * (channels - to_disk) * STORAGE[storage]
+
+
+class Prefetcher:
+    """decode files next to the current one on a thread pool into a cache
+
+    prefetches still queued are cancelled once their file is neither a
+    neighbour nor asked for, so stepping quickly through a directory only
+    decodes the files around where it stops
+    """
+
+    def __init__(self, cache, workers=2, height_cache=None, storage="float32"):
+        self.cache = cache
+        self.height_cache = height_cache  # HeightCache shared by all loads
+        self.storage = storage  # HSAFM storage of decoded stacks
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}
+        self._progress = {}  # frames decoded so far by running prefetches
+        self._lock = threading.Lock()
+
+    def _load(self, fname):
+        try:
+            hsafm = HSAFM(
+                fname, mmap=True, cache=self.height_cache, storage=self.storage
+            )
+            for done in hsafm.load(cache=self.height_cache):
+                self._progress[fname] = done
+            self.cache.put(fname, hsafm)
+        finally:
+            with self._lock:
+                self._pending.pop(fname, None)
+                self._progress.pop(fname, None)
+
+    def prefetch(self, fnames):
+        fnames = list(fnames)
+        with self._lock:
+            for fname, future in list(self._pending.items()):
+                if fname not in fnames and future.cancel():
+                    del self._pending[fname]
+        for fname in fnames:
+            if fname in self.cache:
+                continue
+            try:
+                header = read_header(fname, frame_headers=False)
+            except (OSError, ValueError, IndexError):
+                continue
+            shape = (
+                count_frames(fname, header),
+                int(header["yPixel"]) - 1,
+                int(header["xPixel"]) - 1,
+            )
+            size = ram_bytes(
+                shape, header["numberChannels"], self.height_cache, self.storage
+            )
+            if size > self.cache.max_bytes:
+                continue
+            with self._lock:
+                if fname not in self._pending:
+                    self._pending[fname] = self._pool.submit(self._load, fname)
+
+    def get(self, fname):
+        """decoded HSAFM from the cache or None, never waits
+
+        a prefetch of fname still queued is cancelled, the caller opens the
+        file itself; one already running is left to finish, see decoding()
+        """
+        with self._lock:
+            future = self._pending.get(fname)
+            if future is not None and future.cancel():
+                del self._pending[fname]
+        return self.cache.get(fname)
+
+    def decoding(self, fname):
+        """the future of a running prefetch of fname, or None"""
+        with self._lock:
+            return self._pending.get(fname)
+
+    def progress(self, fname):
+        """frames decoded so far by the running prefetch of fname"""
+        return self._progress.get(fname, 0)
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait)
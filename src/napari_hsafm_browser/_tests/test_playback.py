@@ -0,0 +1,25 @@
+import numpy as np
+
+from napari_hsafm_browser._playback import PlaybackCache, to_uint8
+
+
+def test_to_uint8():
+    frames = np.array([[-1.0, 0.0, 5.0, 10.0, 11.0]], dtype="float32")
+    np.testing.assert_array_equal(to_uint8(frames, (0, 10)), [[0, 0, 128, 255, 255]])
+
+
+def test_playback_cache():
+    stack = np.random.default_rng(0).random((10, 8, 8), dtype="float32")
+    cache = PlaybackCache(stack)
+    cache.set_limits((0.2, 0.8))
+    expected = to_uint8(stack, (0.2, 0.8))
+    np.testing.assert_array_equal(cache.data[3], expected[3])  # converted on demand
+    assert list(cache.build(start=6, chunk=4)) == [4, 6, 10]
+    assert cache.ready.all()
+    np.testing.assert_array_equal(cache.data[:], expected)
+
+    # new limits stop a running build and invalidate the copy
+    build = cache.build(chunk=4)
+    next(build)
+    cache.set_limits((0, 1))
+    assert list(build) == [] and not cache.ready.any()
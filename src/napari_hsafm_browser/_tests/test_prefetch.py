@@ -0,0 +1,61 @@
+import threading
+
+from hsafm_base.cache import HeightCache
+from hsafm_base.testing import make_voltage, write_asd
+from napari_hsafm_browser._prefetch import HSAFMCache, Prefetcher
+
+
+class Sized:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+def test_cache_evicts_least_recently_used():
+    cache = HSAFMCache(max_bytes=100)
+    cache.put("a", Sized(40))
+    cache.put("b", Sized(40))
+    cache.get("a")
+    cache.put("c", Sized(40))
+    assert "a" in cache and "c" in cache and "b" not in cache
+    cache.put("huge", Sized(200))
+    assert "huge" not in cache
+    assert cache.nbytes == 80
+
+
+def test_prefetch(tmp_path):
+    fname = write_asd(str(tmp_path / "a.asd"), make_voltage(5, 16, 16))
+    prefetcher = Prefetcher(HSAFMCache(max_bytes=2 ** 20))
+    prefetcher.prefetch([fname])
+    prefetcher.shutdown(wait=True)
+    hsafm = prefetcher.get(fname)
+    assert hsafm.height.shape == (5, 15, 15)
+
+
+def test_prefetch_cancels_queued(tmp_path):
+    a, b, c = (
+        write_asd(str(tmp_path / f"{name}.asd"), make_voltage(5, 16, 16))
+        for name in "abc"
+    )
+    prefetcher = Prefetcher(HSAFMCache(max_bytes=2 ** 20), workers=1)
+    busy = threading.Event()
+    prefetcher._pool.submit(busy.wait)  # keeps the prefetches queued
+    prefetcher.prefetch([a, b, c])
+    prefetcher.prefetch([b, c])  # a is no longer a neighbour
+    assert prefetcher.decoding(a) is None
+    assert prefetcher.get(b) is None  # asked for while queued, not waited on
+    assert prefetcher.decoding(b) is None
+    busy.set()
+    prefetcher.shutdown(wait=True)
+    assert c in prefetcher.cache
+    assert a not in prefetcher.cache and b not in prefetcher.cache
+
+
+def test_prefetch_skips_files_over_the_limit(tmp_path):
+    fname = write_asd(str(tmp_path / "a.asd"), make_voltage(20, 64, 64))
+    # 20 x 63 x 63 float32 is about 320 kB, neither cache takes it
+    height_cache = HeightCache(str(tmp_path / "cache"), max_bytes=10 ** 4)
+    prefetcher = Prefetcher(HSAFMCache(max_bytes=10 ** 4), height_cache=height_cache)
+    prefetcher.prefetch([fname])
+    assert prefetcher.decoding(fname) is None
+    prefetcher.shutdown(wait=True)
+    assert fname not in prefetcher.cache